@@ -1,12 +1,21 @@
 import os
 import json
 import glob
+import time
 import argparse
 from tqdm import tqdm
-from transformers import pipeline
+import tracing
+from engine import ANSWER_END, PRECISIONS, AuditEngine, TokenBudget, decoding
+from item_store import ItemStore
+from prescreen import apply_cascade, compute_features, format_prescreen, load_rules
+from result_writer import ResultWriter
+from verdict_cache import VerdictCache, make_key, model_fingerprint
 
+DATASETS = ["Clothing", "MIND", "ml-1M"]
 
-def build_prompt(dataset, items):
+
+def build_prompt_parts(dataset, items):
+    # Returns (header, items): the header is identical for every user of a dataset.
     if dataset == "Clothing":
         prompt_items = '\n\n'.join([
             f"{i+1}. Title: {item.get('title', 'N/A')}\n"
@@ -26,9 +35,9 @@ def build_prompt(dataset, items):
             "Cross-gender activity is not inherently fake, but it becomes suspicious if the user interacts with both male and female products in a scattered, inconsistent, or unbalanced way.\n"
             "Please respond with the following format exactly:\n"
             "<think>\n<your reasoning>\n</think>\n<answer>\nReal or Fake\n</answer>"
-            "\nHere is the list of fashion products the user interacted with:\n{prompt_items}"
+            "\nHere is the list of fashion products the user interacted with:\n"
         )
-        return input_template.format(prompt_items=prompt_items)
+        return input_template, prompt_items
 
     elif dataset == "MIND":
         prompt_items = '\n\n'.join([
@@ -50,9 +59,9 @@ def build_prompt(dataset, items):
             "You may also draw on your own knowledge and intuition to assist in determining whether the user's behavior resembles that of a genuine human.\n"
             "Please respond with the following format exactly:\n"
             "<think>\n<your reasoning>\n</think>\n<answer>\nReal or Fake\n</answer>"
-            "\nHere is the list of news items the user interacted with:\n{prompt_items}"
+            "\nHere is the list of news items the user interacted with:\n"
         )
-        return input_template.format(prompt_items=prompt_items)
+        return input_template, prompt_items
 
     elif dataset == "ml-1M":
         prompt_movies = '\n'.join([
@@ -70,67 +79,369 @@ def build_prompt(dataset, items):
             "In this movie recommendation system, there are only 18 movie genres in total, so if a user interacts with almost all 18 genres, trust should be lowered accordingly!\n"
             "Please respond with the following format exactly:\n"
             "<think>\n<your reasoning>\n</think>\n<answer>\nReal or Fake\n</answer>"
-            f"Here is the list of movies the user interacted with:\n{prompt_movies}"
+            "Here is the list of movies the user interacted with:\n"
         )
-        return prompt
+        return prompt, prompt_movies
 
     else:
         raise ValueError(f"Unsupported dataset: {dataset}")
 
 
-def main():
+def build_prompt(dataset, items):
+    header, prompt_items = build_prompt_parts(dataset, items)
+    return header + prompt_items
+
+
+def format_score(margin, p_fake, threshold, explanation=None):
+    verdict = "Fake" if p_fake >= threshold else "Real"
+    res = f"P(fake): {p_fake:.4f}\nMargin: {margin:.4f}\n<answer>\n{verdict}\n</answer>"
+    if explanation is not None:
+        res += "\nExplanation:\n" + explanation
+    return res
+
+
+def run_score(engine, prompts, args):
+    scores = engine.score(prompts, scale=args.score_scale, bias=args.score_bias)
+
+    if args.explain == "all":
+        explain = [i for i, (_, _, _, error) in enumerate(scores) if error is None]
+    elif args.explain == "uncertain":
+        low, high = args.uncertain_band
+        explain = [i for i, (_, p_fake, _, error) in enumerate(scores) if error is None and low <= p_fake <= high]
+    else:
+        explain = []
+
+    explanations = {}
+    for j, res, info in engine.run([prompts[i] for i in explain]):
+        explanations[explain[j]] = (res, info)
+
+    for idx, (margin, p_fake, latency, error) in enumerate(scores):
+        if error is not None:
+            # Same record as a failed generate batch, so --resume retries the user.
+            yield idx, error, {"generated_tokens": 0, "latency_s": latency}
+            continue
+        res, info = explanations.get(idx, (None, {"generated_tokens": 0, "latency_s": 0.0}))
+        info.update({"p_fake": p_fake, "margin": margin, "latency_s": latency + info["latency_s"]})
+        yield idx, format_score(margin, p_fake, args.threshold, res), info
+
+
+def cache_params(args):
+    params = {
+        "max_new_tokens": args.max_new_tokens,
+        "stop_strings": [ANSWER_END],
+        "mode": args.mode,
+        **decoding(args.greedy),
+    }
+    if args.precision != "fp32":
+        # Keeps keys of existing full-precision caches valid.
+        params["precision"] = args.precision
+    adapter = parse_adapters(args.adapters).get(args.dataset)
+    if adapter:
+        params["adapter"] = model_fingerprint(adapter)
+    if args.mode == "score":
+        params.update({
+            "threshold": args.threshold,
+            "explain": args.explain,
+            "uncertain_band": list(args.uncertain_band),
+            "scale": args.score_scale,
+            "bias": args.score_bias,
+        })
+    return params
+
+
+# Per-user work counters; a cache hit did none of this work, so they are reset (latency to the
+# lookup time) and the original run's values kept under "cached_<name>".
+WORK_COUNTERS = ["generated_tokens", "saved_tokens", "target_steps", "draft_tokens", "latency_s"]
+
+
+def run_cached(cache, keys, prompts, run_fn):
+    # Users whose (model, prompt, params) key is cached skip the model entirely.
+    start = time.perf_counter()
+    hits = cache.get_many(keys)
+    # Wall time of the lookup the hit was served from.
+    latency = time.perf_counter() - start
+    misses = [i for i, key in enumerate(keys) if key not in hits]
+    for i, key in enumerate(keys):
+        if key in hits:
+            info = {**hits[key]["info"], "cached": True}
+            for name in WORK_COUNTERS:
+                if name in info:
+                    info[f"cached_{name}"] = info[name]
+                    info[name] = 0
+            info["latency_s"] = latency
+            yield i, hits[key]["response"], info
+
+    for j, res, info in run_fn([prompts[i] for i in misses]):
+        i = misses[j]
+        if not res.startswith("Error:"):
+            cache.put(keys[i], {"response": res, "info": info})
+        yield i, res, info
+
+
+def run_prescreened(stages, rules, features, prompts, run_fn):
+    # Users settled by the statistical cascade never reach the model.
+    for i, stage in enumerate(stages):
+        if stage >= 0:
+            info = {"generated_tokens": 0, "latency_s": 0.0, "prescreen": rules[stage]["name"]}
+            yield i, format_prescreen(rules[stage], features, i), info
+
+    remaining = [i for i, stage in enumerate(stages) if stage < 0]
+    for j, res, info in run_fn([prompts[i] for i in remaining]):
+        yield remaining[j], res, info
+
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def input_files(args):
+    # (file_stem, loader) pairs; a store yields memory-mapped user histories instead of parsed JSON.
+    if args.store_dir:
+        store = ItemStore(args.store_dir)
+        if store.dataset != args.dataset:
+            raise ValueError(f"{args.store_dir} holds {store.dataset} data, not {args.dataset}")
+        return [(stem, lambda stem=stem: store.users(stem)) for stem in store.files()]
+    return [
+        (os.path.splitext(os.path.basename(file))[0], lambda file=file: load_json(file))
+        for file in glob.glob(f'{args.data_dir}/*.json')
+    ]
+
+
+def add_engine_args(parser):
+    # Model and decoding options shared by the batch CLI, the shard runner and the audit service.
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the model checkpoint")
+    parser.add_argument("--device", type=int, default=0, help="GPU id (or -1 for CPU)")
+    parser.add_argument("--precision", type=str, default="fp32", choices=PRECISIONS,
+                        help="Model weights: fp32, bf16, int8 (dynamic quantization, CPU only) or int4 (weight-only, needs optimum-quanto)")
+    parser.add_argument("--batch_size", type=int, default=8, help="Maximum number of users per generation batch")
+    parser.add_argument("--max_batch_tokens", type=int, default=None,
+                        help="Upper bound on padded prompt + new tokens per batch (default: no limit)")
+    parser.add_argument("--max_new_tokens", type=int, default=512, help="Hard cap on generated tokens per user")
+    parser.add_argument("--adaptive_budget", action="store_true",
+                        help="Derive max_new_tokens from observed completion lengths (percentile + margin, capped)")
+    parser.add_argument("--budget_percentile", type=float, default=99, help="Completion-length percentile for the budget")
+    parser.add_argument("--budget_margin", type=int, default=32, help="Tokens added on top of the percentile")
+    parser.add_argument("--prefix_cache", action="store_true",
+                        help="Encode the shared dataset guideline header once and reuse its KV cache for every user")
+    parser.add_argument("--mode", type=str, default="generate", choices=["generate", "score"],
+                        help="generate: sampled reasoning + verdict; score: one forward pass comparing the Real/Fake logits")
+    parser.add_argument("--threshold", type=float, default=0.5, help="P(fake) at or above which score mode answers Fake")
+    parser.add_argument("--explain", type=str, default="none", choices=["none", "uncertain", "all"],
+                        help="Score mode: which users also get a generated explanation")
+    parser.add_argument("--uncertain_band", type=float, nargs=2, default=[0.3, 0.7], metavar=("LOW", "HIGH"),
+                        help="P(fake) range treated as uncertain by --explain uncertain")
+    parser.add_argument("--calibration", type=str, default=None,
+                        help="JSON file with Platt scaling parameters {scale, bias} written by calibrate.py")
+    parser.add_argument("--adapters", type=str, nargs='+', default=None, metavar="DATASET=PATH",
+                        help="LoRA adapters trained per dataset on the --model_path base; the one matching the "
+                             "dataset of each user is applied (datasets without one use the base model)")
+    parser.add_argument("--greedy", action="store_true",
+                        help="Greedy decoding instead of low-temperature sampling (speculative runs then match plain decoding token for token)")
+    parser.add_argument("--draft_model", type=str, default=None,
+                        help="Smaller checkpoint with the same tokenizer that drafts tokens for speculative decoding")
+    parser.add_argument("--draft_tokens", type=int, default=None,
+                        help="Initial number of tokens the draft model proposes per step (adapted during generation)")
+    parser.add_argument("--prompt_lookup", type=int, default=None, metavar="N",
+                        help="Speculative decoding without a draft model: propose up to N tokens by matching the last "
+                             "n-gram against the prompt (the reasoning quotes item titles)")
+
+
+def build_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"],
                         help="Which dataset format to use")
-    parser.add_argument("--data_dir", type=str, required=True, help="Path to input JSON files")
+    parser.add_argument("--data_dir", type=str, default=None, help="Path to input JSON files")
+    parser.add_argument("--store_dir", type=str, default=None,
+                        help="Read users from an item_store.py store instead of --data_dir JSON files")
     parser.add_argument("--out_dir", type=str, required=True, help="Path to save outputs")
-    parser.add_argument("--model_path", type=str, required=True, help="Path to the model checkpoint")
-    parser.add_argument("--device", type=int, default=0, help="GPU id (or -1 for CPU)")
-    args = parser.parse_args()
+    add_engine_args(parser)
+    add_run_args(parser)
+    return parser
+
+
+def add_run_args(parser):
+    # Output, caching, pre-screen and tracing options of a batch audit run (audit_users.py, shard_runner.py, multi_audit.py).
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip users already recorded in <file>.jsonl by an earlier, interrupted run")
+    parser.add_argument("--durability", type=str, default="batch", choices=["always", "batch", "none"],
+                        help="always: fsync every user; batch: fsync every group commit; none: flush only")
+    parser.add_argument("--commit_every", type=int, default=32, help="Users per group commit")
+    parser.add_argument("--commit_interval", type=float, default=10.0, help="Maximum seconds between group commits")
+    parser.add_argument("--prescreen", action="store_true",
+                        help="Settle clear-cut users with the statistical pre-screen cascade before the LLM")
+    parser.add_argument("--prescreen_rules", type=str, default=None,
+                        help="JSON cascade rules for --prescreen (default: built-in rules in prescreen.py)")
+    parser.add_argument("--cache_path", type=str, default=None,
+                        help="SQLite verdict cache shared across files, runs and processes (default: disabled)")
+    parser.add_argument("--cache_max_entries", type=int, default=None, help="Evict least recently used entries beyond this count")
+    parser.add_argument("--cache_max_mb", type=float, default=None, help="Evict least recently used entries beyond this size")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="Record per-file and per-user stage spans (load, build_prompt, tokenize, generate, write, "
+                             "commit) as Chrome trace JSON for Perfetto / chrome://tracing, and print a stage summary")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Sample the generation calls with pyinstrument (cProfile if not installed) and save "
+                             "the report here (.html for pyinstrument's HTML view)")
+
+
+def parse_args(parser, argv=None):
+    args = parser.parse_args(argv)
+    if (args.data_dir is None) == (args.store_dir is None):
+        parser.error("exactly one of --data_dir and --store_dir is required")
+    return load_calibration(args)
+
+
+def load_calibration(args):
+    args.score_scale, args.score_bias = 1.0, 0.0
+    if args.calibration:
+        with open(args.calibration, 'r') as f:
+            calibration = json.load(f)
+        args.score_scale, args.score_bias = calibration["scale"], calibration["bias"]
+    return args
+
+
+def parse_adapters(specs):
+    adapters = {}
+    for spec in specs or []:
+        dataset, sep, path = spec.partition("=")
+        if not sep or dataset not in DATASETS:
+            raise ValueError(f"--adapters expects DATASET=PATH with DATASET in {DATASETS}, got {spec!r}")
+        adapters[dataset] = path
+    return adapters
+
+
+def make_engine(args, device=None):
+    engine = AuditEngine(
+        args.model_path,
+        device=args.device if device is None else device,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        max_new_tokens=args.max_new_tokens,
+        budget=TokenBudget(args.max_new_tokens, args.budget_percentile, args.budget_margin) if args.adaptive_budget else None,
+        precision=args.precision,
+        greedy=args.greedy,
+        draft_model=args.draft_model,
+        prompt_lookup=args.prompt_lookup,
+        draft_tokens=args.draft_tokens,
+        adapters=parse_adapters(args.adapters)
+    )
+    if args.prefix_cache:
+        for dataset in engine.adapters:
+            engine.set_adapter(dataset)
+            engine.set_prefix(build_prompt_parts(dataset, [])[0])
+    engine.set_adapter(args.dataset if args.dataset in engine.adapters else None)
+    if args.prefix_cache and engine.prefix_cache is None:
+        engine.set_prefix(build_prompt_parts(args.dataset, [])[0])
+    return engine
+
+
+def make_run_fn(engine, args):
+    # run_fn(prompts) yields (index, response, info) for every prompt, in any order.
+    if args.mode == "generate":
+        return engine.run
+    return lambda prompts: run_score(engine, prompts, args)
 
-    os.makedirs(args.out_dir, exist_ok=True)
 
-    generator = pipeline(
-        "text-generation",
-        model=args.model_path,
-        device=args.device
+def audit_file(args, file_stem, load, run_fn, rules, cache):
+    out_path = os.path.join(args.out_dir, file_stem + '.txt')
+    jsonl_path = os.path.join(args.out_dir, file_stem + '.jsonl')
+
+    with tracing.span("load", "file", file=file_stem):
+        data = load()
+
+    writer = ResultWriter(
+        out_path,
+        jsonl_path,
+        order=list(data.keys()),
+        resume=args.resume,
+        durability=args.durability,
+        commit_every=args.commit_every,
+        commit_interval=args.commit_interval
     )
+    user_ids = [user_id for user_id in data.keys() if user_id not in writer.done]
+    if args.resume and writer.done:
+        print(f"{file_stem}: resuming, {len(writer.done)} users already audited, {len(user_ids)} left")
+    prompts = []
+    for user_id in user_ids:
+        with tracing.span("build_prompt", "user", user=user_id):
+            prompts.append(build_prompt(args.dataset, data[user_id]))
+
+    # Batches finish out of order; each user is written as soon as it is done so a preempted
+    # run keeps it, and the writer puts the .txt back in the original order on close.
+    with writer:
+        if rules is not None:
+            # Features use the whole file (item popularity), even when resuming part of it.
+            position = {user_id: i for i, user_id in enumerate(data.keys())}
+            selected = [position[user_id] for user_id in user_ids]
+            with tracing.span("prescreen", "file", file=file_stem):
+                features = compute_features(args.dataset, list(data.values()))
+                features = {name: values[selected] for name, values in features.items()}
+                _, stages = apply_cascade(features, rules)
+            results = run_prescreened(stages, rules, features, prompts, run_fn)
+        else:
+            results = run_fn(prompts)
+        with tracing.span("run", "file", file=file_stem, users=len(prompts)):
+            for idx, res, info in tqdm(results, total=len(prompts), desc=file_stem, leave=False):
+                writer.write(user_ids[idx], res, info)
+
+    token_stats = [{k: v for k, v in r.items() if k != "response"} for r in writer.records]
+    generated = sum(s.get("generated_tokens", 0) for s in token_stats)
+    saved = sum(s.get("saved_tokens", 0) for s in token_stats)
+    with open(os.path.join(args.out_dir, file_stem + '_tokens.json'), 'w') as f:
+        json.dump({"generated_tokens": generated, "saved_tokens": saved, "users": token_stats}, f, indent=2)
+    print(f"{file_stem}: generated {generated} tokens, saved {saved} vs. a {args.max_new_tokens}-token cap")
+    steps = sum(s.get("target_steps", 0) for s in token_stats)
+    if steps:
+        drafted = sum(s.get("draft_tokens", 0) for s in token_stats)
+        print(f"{file_stem}: speculative decoding took {drafted} tokens from the draft "
+              f"({drafted / (drafted + steps) * 100:.1f}%), {(drafted + steps) / steps:.2f} tokens per target step")
+    if rules is not None:
+        screened = sum(1 for r in writer.records if r.get("prescreen"))
+        print(f"{file_stem}: pre-screen resolved {screened} / {len(writer.records)} users")
+    if cache is not None:
+        hits = sum(1 for s in token_stats if s.get("cached"))
+        misses = sum(1 for s in token_stats if not s.get("cached") and not s.get("prescreen"))
+        print(f"{file_stem}: cache hits {hits}, misses {misses}")
+
+
+def audit(args, run_fn):
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    cache = None
+    if args.cache_path:
+        cache = VerdictCache(
+            args.cache_path,
+            max_entries=args.cache_max_entries,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb else None
+        )
+        model_id = model_fingerprint(args.model_path)
+        params = cache_params(args)
+        model_fn = run_fn
+        run_fn = lambda ps: run_cached(cache, [make_key(model_id, p, params) for p in ps], ps, model_fn)
+
+    rules = load_rules(args.dataset, args.prescreen_rules) if args.prescreen else None
+
+    if args.trace or args.profile:
+        # Only this process is traced: with shard_runner, worker tokenization and generation
+        # appear as time inside the parent's "run" span.
+        tracing.start(args.trace, args.profile)
+
+    for file_stem, load in tqdm(input_files(args), desc='Processing files'):
+        with tracing.span("file", "file", file=file_stem):
+            audit_file(args, file_stem, load, run_fn, rules, cache)
 
-    files = glob.glob(f'{args.data_dir}/*.json')
-
-    for file in tqdm(files, desc='Processing files'):
-        filename = os.path.basename(file)
-        file_stem = os.path.splitext(filename)[0]
-        out_path = os.path.join(args.out_dir, file_stem + '.txt')
-
-        with open(file, 'r') as f:
-            data = json.load(f)
-
-        with open(out_path, 'w') as fout:
-            for user_id, items in data.items():
-                prompt = build_prompt(args.dataset, items)
-
-                try:
-                    res = generator(
-                        [{"role": "user", "content": prompt}],
-                        max_new_tokens=512,
-                        temperature=0.1,
-                        top_p=0.9,
-                        top_k=50,
-                        return_full_text=False
-                    )[0]["generated_text"].strip()
-                except Exception as e:
-                    res = f"Error: {e}"
-
-                print(f"\nUser: {user_id}")
-                print(res)
-                print("=" * 60)
-
-                fout.write(f"User: {user_id}\n\n")
-                fout.write(res + "\n")
-                fout.write("=" * 60 + "\n")
-                fout.flush()
-                os.fsync(fout.fileno())
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Verdict cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate'] * 100:.1f}% hit rate)")
+        cache.close()
+
+    tracing.finish()
+
+
+def main():
+    args = parse_args(build_parser())
+    engine = make_engine(args)
+    audit(args, make_run_fn(engine, args))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from benchmark import add_worker_args, peak_rss_mb, rss_mb, run_workers, synthetic_item, write_worker_result
+
+
+def merge_adapter(base_model, adapter, out):
+    # A dataset-specialized full checkpoint, i.e. what each dataset needs without adapters.
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = PeftModel.from_pretrained(AutoModelForCausalLM.from_pretrained(base_model), adapter)
+    model.merge_and_unload().save_pretrained(out)
+    AutoTokenizer.from_pretrained(base_model).save_pretrained(out)
+    return out
+
+
+def sample_prompts(dataset, n, seed):
+    from audit_users import build_prompt
+
+    rng = random.Random(seed)
+    return [build_prompt(dataset, [synthetic_item(dataset, rng) for _ in range(10)]) for _ in range(n)]
+
+
+def worker(args):
+    import torch
+    from engine import AuditEngine
+
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    spec = json.loads(args.worker)
+    start_rss = rss_mb()
+
+    start = time.perf_counter()
+    if spec["layout"] == "full":
+        engines = {
+            dataset: AuditEngine(path, device=args.device, batch_size=args.batch_size, max_new_tokens=8)
+            for dataset, path in spec["models"].items()
+        }
+    else:
+        engine = AuditEngine(args.base_model, device=args.device, batch_size=args.batch_size, max_new_tokens=8,
+                             adapters=spec["adapters"])
+        engines = {dataset: engine for dataset in spec["adapters"]}
+    load_s = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    switch_ms = None
+    if spec["layout"] == "adapters":
+        names = list(spec["adapters"])
+        start = time.perf_counter()
+        for i in range(args.switches):
+            engine.set_adapter(names[i % len(names)])
+        switch_ms = (time.perf_counter() - start) / args.switches * 1000 if args.switches else 0.0
+
+    margins = {}
+    start = time.perf_counter()
+    for dataset, eng in engines.items():
+        if spec["layout"] == "adapters":
+            eng.set_adapter(dataset)
+        margins[dataset] = [m for m, _, _, _ in eng.score(sample_prompts(dataset, args.users, args.seed))]
+    score_s = time.perf_counter() - start
+
+    report = {
+        "layout": spec["layout"],
+        "models": len(engines),
+        "load_s": load_s,
+        # Weights may be memory-mapped and only become resident once used, so memory is
+        # read both right after loading and after every model has scored its users.
+        "loaded_rss_mb": loaded_rss - start_rss,
+        "rss_mb": rss_mb() - start_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "switch_ms": switch_ms,
+        "score_s": score_s,
+        "margins": margins,
+    }
+    write_worker_result(args, report)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare one full checkpoint per dataset against one base model with per-dataset LoRA adapters"
+    )
+    parser.add_argument("--base_model", type=str, required=True, help="Base checkpoint the adapters were trained on")
+    parser.add_argument("--adapters", type=str, nargs='+', required=True, metavar="DATASET=PATH")
+    parser.add_argument("--full_models", type=str, nargs='*', default=None, metavar="DATASET=PATH",
+                        help="Dataset-specialized full checkpoints (default: merge each adapter into the base)")
+    parser.add_argument("--device", type=int, default=-1, help="GPU id (or -1 for CPU)")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--users", type=int, default=8, help="Synthetic users scored per dataset to check the outputs agree")
+    parser.add_argument("--switches", type=int, default=100, help="Adapter switches timed")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads per run (default: torch's choice)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=str, default=None, help="Optional JSON file for both reports")
+    add_worker_args(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    from audit_users import parse_adapters
+
+    adapters = parse_adapters(args.adapters)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.full_models:
+            full_models = parse_adapters(args.full_models)
+        else:
+            print("Merging adapters into full checkpoints ...", flush=True)
+            full_models = {
+                dataset: merge_adapter(args.base_model, path, os.path.join(tmp, dataset))
+                for dataset, path in adapters.items()
+            }
+
+        layouts = [{"layout": "full", "models": full_models}, {"layout": "adapters", "adapters": adapters}]
+        runs = run_workers(__file__, [(spec["layout"], json.dumps(spec)) for spec in layouts], action="Loading")
+
+    print("=" * 84)
+    print(f"{'layout':<10}{'models':>8}{'load s':>9}{'load MB':>10}{'RSS MB':>10}{'peak MB':>10}{'switch ms':>11}{'score s':>9}")
+    for r in runs:
+        switch = f"{r['switch_ms']:.2f}" if r["switch_ms"] is not None else "-"
+        print(f"{r['layout']:<10}{r['models']:>8}{r['load_s']:>9.2f}{r['loaded_rss_mb']:>10.0f}{r['rss_mb']:>10.0f}"
+              f"{r['peak_rss_mb']:>10.0f}{switch:>11}{r['score_s']:>9.2f}")
+    print("=" * 84)
+    if len(runs) == 2:
+        full, lora = runs
+        print(f"Full checkpoints / adapters: load time x{full['load_s'] / lora['load_s']:.2f}, "
+              f"resident memory x{full['rss_mb'] / max(lora['rss_mb'], 1e-9):.2f}")
+        diffs = [abs(a - b) for dataset in full["margins"] if dataset in lora["margins"]
+                 for a, b in zip(full["margins"][dataset], lora["margins"][dataset])]
+        if diffs:
+            print(f"Max |margin| difference between merged and adapter outputs: {max(diffs):.2e}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
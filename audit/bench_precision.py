@@ -0,0 +1,132 @@
+import os
+import json
+import glob
+import time
+import argparse
+import tempfile
+
+from benchmark import add_worker_args, peak_rss_mb, rss_mb, run_workers, write_worker_result
+from engine import PRECISIONS
+
+
+def worker(args):
+    import torch
+    from audit_users import build_parser, build_prompt, make_engine, make_run_fn, parse_args
+    from result_writer import extract_verdict, user_label
+
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    users = []
+    for file in sorted(glob.glob(f'{args.data_dir}/*.json')):
+        with open(file, 'r') as f:
+            data = json.load(f)
+        stem = os.path.splitext(os.path.basename(file))[0]
+        for user_id in list(data.keys())[:args.max_users]:
+            users.append((stem, user_id, build_prompt(args.dataset, data[user_id])))
+
+    audit_args = parse_args(build_parser(), [
+        "--dataset", args.dataset, "--data_dir", args.data_dir, "--out_dir", tempfile.gettempdir(),
+        "--model_path", args.model_path, "--device", str(args.device), "--precision", args.worker,
+        "--batch_size", str(args.batch_size), "--max_new_tokens", str(args.max_new_tokens), "--mode", args.mode,
+    ])
+    start = time.perf_counter()
+    engine = make_engine(audit_args)
+    load_s = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    run_fn = make_run_fn(engine, audit_args)
+    results = [None] * len(users)
+    generated = 0
+    start = time.perf_counter()
+    for idx, res, info in run_fn([prompt for _, _, prompt in users]):
+        results[idx] = (extract_verdict(res), info.get("p_fake"))
+        generated += info.get("generated_tokens", 0)
+    run_s = time.perf_counter() - start
+
+    report = {
+        "precision": args.worker,
+        "users": len(users),
+        "load_s": load_s,
+        "run_s": run_s,
+        "generated_tokens": generated,
+        "loaded_rss_mb": loaded_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "verdicts": [
+            {"file": stem, "user_id": user_id, "label": user_label(user_id), "verdict": verdict, "p_fake": p_fake}
+            for (stem, user_id, _), (verdict, p_fake) in zip(users, results)
+        ],
+    }
+    write_worker_result(args, report)
+
+
+def compare(baseline, run):
+    pairs = list(zip(baseline["verdicts"], run["verdicts"]))
+    agree = sum(1 for a, b in pairs if a["verdict"] == b["verdict"])
+    correct = sum(1 for r in run["verdicts"] if r["verdict"] == r["label"])
+    summary = {
+        "precision": run["precision"],
+        "users": run["users"],
+        "users_per_s": run["users"] / run["run_s"] if run["run_s"] else 0.0,
+        "tokens_per_s": run["generated_tokens"] / run["run_s"] if run["run_s"] else 0.0,
+        "load_s": run["load_s"],
+        "loaded_rss_mb": run["loaded_rss_mb"],
+        "peak_rss_mb": run["peak_rss_mb"],
+        "agreement": agree / len(pairs) if pairs else 0.0,
+        "flipped_to_real": sum(1 for a, b in pairs if a["verdict"] == "fake" and b["verdict"] == "real"),
+        "flipped_to_fake": sum(1 for a, b in pairs if a["verdict"] == "real" and b["verdict"] == "fake"),
+        "accuracy": correct / run["users"] if run["users"] else 0.0,
+    }
+    scored = [(a["p_fake"], b["p_fake"]) for a, b in pairs if a["p_fake"] is not None and b["p_fake"] is not None]
+    if scored:
+        summary["mean_abs_p_fake_diff"] = sum(abs(a - b) for a, b in scored) / len(scored)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare audit speed, memory and verdict agreement across model precisions")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"])
+    parser.add_argument("--data_dir", type=str, required=True, help="Path to input JSON files")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the model checkpoint")
+    parser.add_argument("--device", type=int, default=-1, help="GPU id (or -1 for CPU)")
+    parser.add_argument("--precisions", type=str, nargs='+', default=["fp32", "bf16", "int8"], choices=PRECISIONS,
+                        help="Precisions to compare; the first one is the agreement baseline")
+    parser.add_argument("--mode", type=str, default="generate", choices=["generate", "score"],
+                        help="score mode is deterministic, so disagreements come from precision alone")
+    parser.add_argument("--max_users", type=int, default=32, help="Users per file")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--max_new_tokens", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads per run (default: torch's choice)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=str, default=None, help="Optional JSON file for the summary and per-user verdicts")
+    add_worker_args(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    # A failed run (e.g. int4 without optimum-quanto) is skipped.
+    runs = run_workers(__file__, [(precision, precision) for precision in args.precisions])
+
+    if not runs:
+        raise SystemExit("No precision ran successfully")
+    summaries = [compare(runs[0], run) for run in runs]
+    print("=" * 100)
+    print(f"{'precision':<10}{'users/s':>10}{'tokens/s':>10}{'load s':>9}{'RSS MB':>9}{'peak MB':>9}"
+          f"{'agree':>8}{'->real':>8}{'->fake':>8}{'acc':>7}")
+    for s in summaries:
+        print(f"{s['precision']:<10}{s['users_per_s']:>10.3f}{s['tokens_per_s']:>10.1f}{s['load_s']:>9.1f}"
+              f"{s['loaded_rss_mb']:>9.0f}{s['peak_rss_mb']:>9.0f}{s['agreement']:>8.3f}"
+              f"{s['flipped_to_real']:>8}{s['flipped_to_fake']:>8}{s['accuracy']:>7.3f}")
+    print("=" * 100)
+    print(f"Agreement and flips are against {runs[0]['precision']}; ->real counts users it calls fake that the other precision passes as real.")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"summary": summaries, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import glob
+import time
+import argparse
+import statistics
+from tqdm import tqdm
+
+from audit_users import build_prompt, build_prompt_parts
+from engine import AuditEngine
+
+
+def time_prefill(engine, input_ids, prefix_cache):
+    engine.prefix_cache = prefix_cache
+    start = time.perf_counter()
+    for batch in engine.batches(input_ids):
+        engine.prefill_batch([input_ids[i] for i in batch])
+    return time.perf_counter() - start
+
+
+def compare(engine, input_ids, prefix_cache, repeats):
+    # One untimed batch per mode warms up allocator and kernels; the modes then alternate
+    # which one runs first, and the median over repeats is reported.
+    for batch in engine.batches(input_ids)[:1]:
+        for cache in (None, prefix_cache):
+            time_prefill(engine, [input_ids[i] for i in batch], cache)
+    full, reuse = [], []
+    for rep in range(repeats):
+        modes = [(full, None), (reuse, prefix_cache)]
+        for times, cache in (modes if rep % 2 == 0 else modes[::-1]):
+            times.append(time_prefill(engine, input_ids, cache))
+    engine.prefix_cache = prefix_cache
+    return statistics.median(full), statistics.median(reuse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt prefill time with and without shared-prefix KV reuse")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"])
+    parser.add_argument("--data_dir", type=str, required=True, help="Path to input JSON files")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the model checkpoint")
+    parser.add_argument("--device", type=int, default=-1, help="GPU id (or -1 for CPU)")
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--max_users", type=int, default=64, help="Users per file to time")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per mode and file; the median is reported")
+    args = parser.parse_args()
+
+    engine = AuditEngine(args.model_path, device=args.device, batch_size=args.batch_size)
+    header = build_prompt_parts(args.dataset, [])[0]
+
+    start = time.perf_counter()
+    engine.set_prefix(header)
+    prefix_time = time.perf_counter() - start
+
+    results = []
+    for file in tqdm(glob.glob(f'{args.data_dir}/*.json'), desc='Processing files'):
+        with open(file, 'r') as f:
+            data = json.load(f)
+
+        prompts = [build_prompt(args.dataset, items) for items in list(data.values())[:args.max_users]]
+        input_ids = engine.encode(prompts)
+        reusable = sum(engine.uses_prefix([ids]) for ids in input_ids)
+
+        full, reuse = compare(engine, input_ids, engine.prefix_cache, args.repeats)
+
+        results.append({
+            "file": file,
+            "users": len(input_ids),
+            "reusable_users": reusable,
+            "prompt_tokens": sum(len(ids) for ids in input_ids),
+            "full_prefill_s": full,
+            "prefix_reuse_prefill_s": reuse,
+            "speedup": full / reuse if reuse else 0.0,
+        })
+
+    total_full = sum(r["full_prefill_s"] for r in results)
+    total_reuse = sum(r["prefix_reuse_prefill_s"] for r in results)
+    total_users = sum(r["users"] for r in results)
+
+    print(json.dumps(results, indent=2))
+    print("=" * 60)
+    print(f"Prefix tokens: {len(engine.prefix_ids)} (encoded once in {prefix_time * 1000:.1f} ms)")
+    print(f"Users: {total_users}")
+    if total_users:
+        print(f"Full prefill:         {total_full:.2f}s ({total_full / total_users * 1000:.1f} ms/user)")
+        print(f"Prefix-reuse prefill: {total_reuse:.2f}s ({total_reuse / total_users * 1000:.1f} ms/user)")
+    if total_reuse:
+        print(f"Speedup: {total_full / total_reuse:.2f}x")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
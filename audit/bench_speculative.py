@@ -0,0 +1,144 @@
+import os
+import json
+import glob
+import time
+import argparse
+import tempfile
+
+from benchmark import add_worker_args, run_workers, write_worker_result
+
+DATASETS = ["Clothing", "MIND", "ml-1M"]
+
+
+def parse_config(config):
+    # "plain", "lookup:N" or "draft:PATH[:TOKENS]" -> extra audit_users.py arguments
+    if config == "plain":
+        return []
+    kind, _, value = config.partition(":")
+    if kind == "lookup":
+        return ["--prompt_lookup", value or "10"]
+    if kind == "draft":
+        path, _, tokens = value.partition(":")
+        return ["--draft_model", path] + (["--draft_tokens", tokens] if tokens else [])
+    raise ValueError(f"unknown config {config!r}, expected plain, lookup:N or draft:PATH[:TOKENS]")
+
+
+def load_prompts(dataset, data_dir, max_users):
+    from audit_users import build_prompt
+
+    users = []
+    for file in sorted(glob.glob(f'{data_dir}/*.json')):
+        with open(file, 'r') as f:
+            data = json.load(f)
+        users.extend((user_id, build_prompt(dataset, data[user_id])) for user_id in list(data.keys())[:max_users])
+    return users
+
+
+def worker(args):
+    # All datasets run on the same loaded model(s).
+    import torch
+    from audit_users import build_parser, make_engine, parse_args
+    from result_writer import extract_verdict
+
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    audit_args = parse_args(build_parser(), [
+        "--dataset", args.datasets[0], "--data_dir", args.data_root, "--out_dir", tempfile.gettempdir(),
+        "--model_path", args.model_path, "--device", str(args.device), "--batch_size", "1",
+        "--max_new_tokens", str(args.max_new_tokens), "--greedy", *parse_config(args.worker),
+    ])
+    engine = make_engine(audit_args)
+
+    report = {"config": args.worker, "datasets": {}}
+    for dataset in args.datasets:
+        users = load_prompts(dataset, os.path.join(args.data_root, dataset), args.max_users)
+        if not users:
+            continue
+        responses = [None] * len(users)
+        totals = {"generated_tokens": 0, "target_steps": 0, "draft_tokens": 0}
+        start = time.perf_counter()
+        for idx, res, info in engine.run([prompt for _, prompt in users]):
+            responses[idx] = res
+            for key in totals:
+                totals[key] += info.get(key, 0)
+        report["datasets"][dataset] = {
+            "users": len(users),
+            "run_s": time.perf_counter() - start,
+            **totals,
+            "responses": responses,
+            "verdicts": [extract_verdict(res) for res in responses],
+        }
+    write_worker_result(args, report)
+
+
+def compare(baseline, run):
+    rows = []
+    for dataset, r in run["datasets"].items():
+        base = baseline["datasets"].get(dataset)
+        if base is None:
+            continue
+        pairs = list(zip(base["responses"], r["responses"]))
+        verdicts = list(zip(base["verdicts"], r["verdicts"]))
+        steps = r["target_steps"]
+        rows.append({
+            "config": run["config"],
+            "dataset": dataset,
+            "users": r["users"],
+            "run_s": r["run_s"],
+            "speedup": base["run_s"] / r["run_s"] if r["run_s"] else 0.0,
+            "tokens_per_s": r["generated_tokens"] / r["run_s"] if r["run_s"] else 0.0,
+            # Share of emitted tokens that came from accepted drafts.
+            "acceptance": r["draft_tokens"] / (r["draft_tokens"] + steps) if steps else 0.0,
+            "tokens_per_step": (r["draft_tokens"] + steps) / steps if steps else 1.0,
+            "identical": sum(1 for a, b in pairs if a == b) / len(pairs) if pairs else 0.0,
+            "verdict_agreement": sum(1 for a, b in verdicts if a == b) / len(verdicts) if verdicts else 0.0,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare speculative decoding against plain greedy decoding per dataset")
+    parser.add_argument("--model_path", type=str, required=True, help="Audit checkpoint (the target model)")
+    parser.add_argument("--configs", type=str, nargs='+', default=["plain", "lookup:10"],
+                        help="plain, lookup:N (prompt lookup) or draft:PATH[:TOKENS]; the first one is the baseline")
+    parser.add_argument("--datasets", type=str, nargs='+', default=DATASETS, choices=DATASETS)
+    parser.add_argument("--data_root", type=str, default="./data4llm", help="Holds one directory of JSON files per dataset")
+    parser.add_argument("--max_users", type=int, default=8, help="Users per file")
+    parser.add_argument("--device", type=int, default=-1, help="GPU id (or -1 for CPU)")
+    parser.add_argument("--max_new_tokens", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads per run (default: torch's choice)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=str, default=None, help="Optional JSON file for the per-dataset summary")
+    add_worker_args(parser)
+    args = parser.parse_args()
+    for config in args.configs:
+        parse_config(config)
+
+    if args.worker:
+        worker(args)
+        return
+
+    runs = run_workers(__file__, [(config, config) for config in args.configs])
+
+    if not runs:
+        raise SystemExit("No configuration ran successfully")
+    rows = [row for run in runs for row in compare(runs[0], run)]
+    print("=" * 104)
+    print(f"{'config':<24}{'dataset':<10}{'users':>6}{'run s':>9}{'speedup':>9}{'tok/s':>9}"
+          f"{'accept':>8}{'tok/step':>10}{'identical':>11}{'verdicts':>10}")
+    for r in rows:
+        print(f"{r['config'][-24:]:<24}{r['dataset']:<10}{r['users']:>6}{r['run_s']:>9.2f}{r['speedup']:>9.2f}"
+              f"{r['tokens_per_s']:>9.1f}{r['acceptance'] * 100:>7.1f}%{r['tokens_per_step']:>10.2f}"
+              f"{r['identical'] * 100:>10.1f}%{r['verdict_agreement'] * 100:>9.1f}%")
+    print("=" * 104)
+    print(f"Baseline: {runs[0]['config']}. All runs decode greedily, one user at a time.")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import glob
+import time
+import random
+import resource
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from engine import PRECISIONS
+
+GENRES = ["Action", "Adventure", "Animation", "Children's", "Comedy", "Crime", "Documentary", "Drama", "Fantasy",
+          "Film-Noir", "Horror", "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"]
+NEWS = {"news": ["world", "politics", "crime"], "sports": ["football", "tennis"], "finance": ["markets", "retirement"],
+        "lifestyle": ["travel", "food"], "health": ["fitness", "wellness"], "autos": ["reviews", "recalls"]}
+CLOTHING = ["Women, Clothing, Dresses", "Women, Shoes, Pumps", "Men, Clothing, Shirts", "Men, Shoes, Boots",
+            "Women, Handbags & Wallets", "Men, Accessories, Belts", "Girls, Clothing, Tops", "Boys, Shoes"]
+WORDS = ["classic", "summer", "urban", "vintage", "leather", "cotton", "daily", "report", "new", "best", "guide",
+         "season", "night", "story", "city", "light", "blue", "black", "slim", "casual", "update", "review"]
+
+
+def rss_mb():
+    # Current resident set size; ru_maxrss only gives the peak.
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def add_worker_args(parser):
+    # Hidden arguments run_workers() appends to the command line of each worker process.
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--worker_out", type=str, default=None, help=argparse.SUPPRESS)
+
+
+def run_workers(script, runs, action="Running"):
+    # Re-runs `script` with the current command line once per (name, spec) in `runs`, passing
+    # --worker <spec>, in a fresh process so load time, memory and warm caches of one run do
+    # not carry over into the next. Returns the JSON each worker wrote with write_worker_result().
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (name, spec) in enumerate(runs):
+            out = os.path.join(tmp, f"{i}.json")
+            print(f"{action} {name} ...", flush=True)
+            proc = subprocess.run([sys.executable, os.path.abspath(script), *sys.argv[1:],
+                                   "--worker", spec, "--worker_out", out])
+            if proc.returncode != 0:
+                # The error itself is printed by the worker.
+                print(f"Skipping {name}: run failed with exit code {proc.returncode}")
+                continue
+            with open(out, 'r') as f:
+                results.append(json.load(f))
+    return results
+
+
+def write_worker_result(args, result):
+    with open(args.worker_out, 'w') as f:
+        json.dump(result, f)
+
+
+def synthetic_item(dataset, rng):
+    title = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+    if dataset == "ml-1M":
+        return {"movie_id": str(rng.randint(1, 3952)), "name": f"{title} ({rng.randint(1930, 2000)})",
+                "genres": "|".join(rng.sample(GENRES, rng.randint(1, 3)))}
+    if dataset == "MIND":
+        category = rng.choice(sorted(NEWS))
+        return {"news_id": str(rng.randint(1, 60000)), "category": category, "subcategory": rng.choice(NEWS[category]),
+                "title": title, "abstract": " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 30)))}
+    return {"asin": f"B{rng.randint(10 ** 8, 10 ** 9)}", "title": title,
+            "categories": ["Clothing, Shoes & Jewelry"] + rng.sample(CLOTHING, rng.randint(1, 2))}
+
+
+def load_users(args):
+    # [(source, user_id, items)]; json.load time is reported separately from the audit stages.
+    if args.synthetic_users:
+        rng = random.Random(args.seed)
+        return [
+            ("synthetic", f"fakeUser{i}" if i % 2 else str(i),
+             [synthetic_item(args.dataset, rng) for _ in range(args.history_len)])
+            for i in range(args.synthetic_users)
+        ], 0.0
+
+    users = []
+    start = time.perf_counter()
+    for data_dir in args.data_dirs:
+        for file in sorted(glob.glob(f'{data_dir}/*.json')):
+            with open(file, 'r') as f:
+                data = json.load(f)
+            stem = os.path.splitext(os.path.basename(file))[0]
+            users.extend((stem, user_id, data[user_id]) for user_id in list(data.keys())[:args.max_users])
+    return users, time.perf_counter() - start
+
+
+class StageTimer:
+    # Streamer for model.generate: the first put() carries the prompt, the second the first
+    # sampled token, so the time up to the second call is the prefill (plus one sampling step).
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.calls = 0
+
+    def put(self, value):
+        self.calls += 1
+        if self.calls == 2:
+            self.first_token = time.perf_counter()
+
+    def end(self):
+        self.finished = time.perf_counter()
+
+
+def worker(args):
+    import torch
+    import transformers
+    from audit_users import build_prompt
+    from engine import AuditEngine
+    from result_writer import extract_verdict
+
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model_path = args.worker
+    if model_path == "tiny":
+        from tiny_model import make_tiny_model
+        model_path = make_tiny_model(tempfile.mkdtemp(prefix="tiny_model_"))
+
+    users, load_s = load_users(args)
+
+    start = time.perf_counter()
+    engine = AuditEngine(model_path, device=args.device, batch_size=args.batch_size,
+                         max_batch_tokens=args.max_batch_tokens, max_new_tokens=args.max_new_tokens,
+                         precision=args.precision)
+    model_load_s = time.perf_counter() - start
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+    stages = {"build_prompt": 0.0, "tokenize": 0.0, "prefill": 0.0, "decode": 0.0, "parse": 0.0}
+    latencies = [0.0] * len(users)
+    verdicts = [None] * len(users)
+    generated = 0
+    run_start = time.perf_counter()
+
+    t = time.perf_counter()
+    prompts = [build_prompt(args.dataset, items) for _, _, items in users]
+    stages["build_prompt"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    input_ids = engine.encode(prompts)
+    stages["tokenize"] = time.perf_counter() - t
+
+    if args.mode == "score":
+        batches = engine.batches([ids + engine.answer_ids for ids in input_ids], reserve_tokens=0)
+    else:
+        batches = engine.batches(input_ids)
+    for batch in batches:
+        batch_ids = [input_ids[i] for i in batch]
+        t = time.perf_counter()
+        if args.mode == "score":
+            margins = engine.score_batch(batch_ids)
+            stages["prefill"] += time.perf_counter() - t
+            texts = ["Fake" if m >= 0 else "Real" for m in margins]
+        else:
+            timer = StageTimer()
+            responses = engine.generate_batch(batch_ids, streamer=timer)
+            first = timer.first_token or timer.finished
+            stages["prefill"] += first - timer.start
+            stages["decode"] += timer.finished - first
+            texts = [text for text, _ in responses]
+            generated += sum(n for _, n in responses)
+        latency = time.perf_counter() - t
+
+        t = time.perf_counter()
+        for idx, text in zip(batch, texts):
+            verdicts[idx] = text.lower() if args.mode == "score" else extract_verdict(text)
+            latencies[idx] = latency
+        stages["parse"] += time.perf_counter() - t
+    run_s = time.perf_counter() - run_start
+
+    prompt_tokens = sum(len(ids) for ids in input_ids)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    result = {
+        "model": args.worker,
+        "dataset": args.dataset,
+        "inputs": "synthetic" if args.synthetic_users else args.data_dirs,
+        "mode": args.mode,
+        "precision": args.precision,
+        "users": len(users),
+        "json_load_s": load_s,
+        "model_load_s": model_load_s,
+        "run_s": run_s,
+        "users_per_s": len(users) / run_s if run_s else 0.0,
+        "prompt_tokens": prompt_tokens,
+        "prompt_tokens_per_s": prompt_tokens / run_s if run_s else 0.0,
+        "generated_tokens": generated,
+        "generated_tokens_per_s": generated / run_s if run_s else 0.0,
+        "latency_s": {"p50": float(p50), "p95": float(p95), "p99": float(p99)},
+        "stages_s": stages,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_cuda_mb": torch.cuda.max_memory_allocated() / 2 ** 20 if torch.cuda.is_available() else None,
+        "versions": {"python": platform.python_version(), "torch": torch.__version__, "transformers": transformers.__version__},
+        "threads": torch.get_num_threads(),
+        "config": {k: getattr(args, k) for k in ("batch_size", "max_batch_tokens", "max_new_tokens", "device",
+                                                 "max_users", "synthetic_users", "history_len", "seed")},
+        "verdicts": verdicts if args.keep_verdicts else None,
+    }
+    write_worker_result(args, result)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audit throughput, latency, memory and per-stage time")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"])
+    parser.add_argument("--models", type=str, nargs='+', default=["tiny"],
+                        help="Checkpoint paths; 'tiny' builds a small random Qwen2 model so the benchmark runs offline")
+    parser.add_argument("--data_dirs", type=str, nargs='*', default=None,
+                        help="Directories of data4llm JSON files (default: ./data4llm/<dataset> and ./extra/<dataset>)")
+    parser.add_argument("--max_users", type=int, default=32, help="Users per file")
+    parser.add_argument("--synthetic_users", type=int, default=0, help="Use N synthetic users instead of the data files")
+    parser.add_argument("--history_len", type=int, default=50, help="Items per synthetic user")
+    parser.add_argument("--mode", type=str, default="generate", choices=["generate", "score"])
+    parser.add_argument("--device", type=int, default=-1, help="GPU id (or -1 for CPU)")
+    parser.add_argument("--precision", type=str, default="fp32", choices=PRECISIONS)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--max_batch_tokens", type=int, default=None)
+    parser.add_argument("--max_new_tokens", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep_verdicts", action="store_true", help="Store per-user verdicts in the results")
+    parser.add_argument("--out", type=str, default="bench_results.jsonl",
+                        help="Results are appended here, one JSON record per model, tagged with commit and time")
+    add_worker_args(parser)
+    args = parser.parse_args()
+    if args.data_dirs is None:
+        args.data_dirs = [d for d in (f"./data4llm/{args.dataset}", f"./extra/{args.dataset}") if os.path.isdir(d)]
+
+    if args.worker:
+        worker(args)
+        return
+
+    commit = git_commit()
+    timestamp = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    results = run_workers(__file__, [(model, model) for model in args.models], action="Benchmarking")
+    for result in results:
+        result.update({"commit": commit, "timestamp": timestamp})
+
+    with open(args.out, 'a') as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    print("=" * 110)
+    print(f"{'model':<28}{'users':>7}{'users/s':>9}{'prompt tok/s':>13}{'gen tok/s':>10}"
+          f"{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'peak MB':>9}")
+    for r in results:
+        print(f"{r['model'][-28:]:<28}{r['users']:>7}{r['users_per_s']:>9.2f}{r['prompt_tokens_per_s']:>13.0f}"
+              f"{r['generated_tokens_per_s']:>10.1f}{r['latency_s']['p50']:>8.2f}{r['latency_s']['p95']:>8.2f}"
+              f"{r['latency_s']['p99']:>8.2f}{r['peak_rss_mb']:>9.0f}")
+    print("-" * 110)
+    for r in results:
+        total = sum(r["stages_s"].values()) or 1.0
+        split = "  ".join(f"{name} {s:.2f}s ({s / total * 100:.0f}%)" for name, s in r["stages_s"].items())
+        print(f"{r['model'][-28:]:<28}json_load {r['json_load_s']:.2f}s  {split}")
+    print("=" * 110)
+    print(f"Appended {len(results)} result(s) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import json
+import glob
+import math
+import argparse
+
+from evaluate import iter_jsonl, record_label
+
+
+def read_margins(jsonl_file):
+    # Score-mode records carry the raw fake - real logit margin next to the label.
+    return [
+        (float(r["margin"]), int(record_label(r) == 'fake'))
+        for r in iter_jsonl(jsonl_file) if r.get("margin") is not None
+    ]
+
+
+def fit_platt(samples, iterations=100):
+    # Newton's method on the logistic loss of sigmoid(scale * margin + bias).
+    scale, bias = 1.0, 0.0
+    for _ in range(iterations):
+        g_s = g_b = h_ss = h_sb = h_bb = 0.0
+        for x, y in samples:
+            z = scale * x + bias
+            p = 1.0 / (1.0 + math.exp(-z)) if z >= 0 else math.exp(z) / (1.0 + math.exp(z))
+            w = p * (1.0 - p)
+            g_s += (p - y) * x
+            g_b += p - y
+            h_ss += w * x * x
+            h_sb += w * x
+            h_bb += w
+        # Small damping keeps the step finite when the margins separate the labels.
+        h_ss += 1e-6
+        h_bb += 1e-6
+        det = h_ss * h_bb - h_sb * h_sb
+        if abs(det) < 1e-12:
+            break
+        d_s = (h_bb * g_s - h_sb * g_b) / det
+        d_b = (h_ss * g_b - h_sb * g_s) / det
+        scale -= d_s
+        bias -= d_b
+        if abs(d_s) < 1e-8 and abs(d_b) < 1e-8:
+            break
+    return scale, bias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit Platt scaling for audit_users.py --mode score")
+    parser.add_argument("--out_dir", type=str, required=True, help="Directory with score-mode .jsonl outputs (searched recursively)")
+    parser.add_argument("--output", type=str, default=None, help="Where to write the calibration JSON")
+    args = parser.parse_args()
+
+    samples = []
+    for jsonl_file in sorted(glob.glob(os.path.join(args.out_dir, '**', '*.jsonl'), recursive=True)):
+        samples.extend(read_margins(jsonl_file))
+
+    if not samples or len({y for _, y in samples}) < 2:
+        raise ValueError(f"Need score-mode results for both real and fake users in {args.out_dir}")
+
+    scale, bias = fit_platt(samples)
+    output = args.output or f'{args.out_dir}/calibration.json'
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({"scale": scale, "bias": bias, "samples": len(samples)}, f, indent=2)
+
+    print(f"Fitted on {len(samples)} users: scale={scale:.4f}, bias={bias:.4f}")
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import copy
+
+import math
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, StopStringCriteria, StoppingCriteriaList
+
+import tracing
+
+
+# Forced assistant turn for score mode: empty reasoning, then the verdict token.
+ANSWER_PREFIX = "<think>\n\n</think>\n<answer>\n"
+ANSWER_END = "</answer>"
+
+SAMPLING = {"do_sample": True, "temperature": 0.1, "top_p": 0.9, "top_k": 50}
+GREEDY = {"do_sample": False}
+
+PRECISIONS = ["fp32", "bf16", "int8", "int4"]
+
+
+def sigmoid(x):
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+
+def resolve_device(device):
+    return torch.device(f"cuda:{device}" if device >= 0 else "cpu")
+
+
+def load_model(model_path, device, precision="fp32"):
+    # int8: dynamic quantization of every nn.Linear (int8 weights, activations quantized
+    # per batch), CPU only. int4: weight-only quantization through optimum-quanto.
+    if precision == "int8" and device.type != "cpu":
+        raise ValueError("--precision int8 uses PyTorch dynamic quantization and runs on CPU only (--device -1)")
+    dtype = torch.bfloat16 if precision == "bf16" else torch.float32
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype)
+
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif precision == "int4":
+        try:
+            from optimum.quanto import freeze, qint4, quantize
+        except ImportError:
+            raise ImportError("--precision int4 requires optimum-quanto (pip install optimum-quanto)")
+        # lm_head stays in full precision: the Real/Fake margin is read from its output.
+        quantize(model, weights=qint4, exclude="lm_head")
+        freeze(model)
+    return model.to(device)
+
+
+def load_adapters(model, adapters):
+    # One copy of the base weights with a named LoRA adapter per dataset; set_adapter switches
+    # between them without reloading anything.
+    try:
+        from peft import PeftModel
+    except ImportError:
+        raise ImportError("--adapters requires peft (pip install peft)")
+    names = list(adapters)
+    model = PeftModel.from_pretrained(model, adapters[names[0]], adapter_name=names[0])
+    for name in names[1:]:
+        model.load_adapter(adapters[name], adapter_name=name)
+    return model
+
+
+def decoding(greedy=False):
+    return dict(GREEDY if greedy else SAMPLING)
+
+
+class DraftCounter:
+    # Streamer that counts verification steps of assisted generation. After the prompt, every
+    # put() carries the tokens accepted in one target forward pass: the matched draft tokens plus
+    # the target's own next token. Calls are forwarded to an optional inner streamer.
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.calls = 0
+        self.chunks = []
+
+    def put(self, value):
+        self.calls += 1
+        if self.calls > 1:
+            self.chunks.append(value.numel())
+        if self.inner is not None:
+            self.inner.put(value)
+
+    def count(self, kept):
+        # (target steps, accepted draft tokens) behind the first `kept` output tokens. A chunk cut
+        # by trimming still cost its step, but the tokens kept from it all came from the draft.
+        steps = drafted = 0
+        for size in self.chunks:
+            if kept <= 0:
+                break
+            steps += 1
+            drafted += min(size, kept) - (size <= kept)
+            kept -= size
+        return steps, drafted
+
+    def end(self):
+        if self.inner is not None:
+            self.inner.end()
+
+
+def make_batches(lengths, batch_size, max_batch_tokens=None, reserve_tokens=0):
+    # Longest prompts first so an oversized batch fails at the start of a file,
+    # and neighbouring prompts have similar lengths to keep left padding low.
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    current = []
+    for idx in order:
+        if current:
+            padded = (lengths[current[0]] + reserve_tokens) * (len(current) + 1)
+            if len(current) >= batch_size or (max_batch_tokens and padded > max_batch_tokens):
+                batches.append(current)
+                current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class TokenBudget:
+    # Generation budget taken from observed completion lengths: the given
+    # percentile plus a margin, clipped to [floor, cap]. Uses the cap until
+    # enough completions have been seen.
+    def __init__(self, cap, percentile=99, margin=32, warmup=32, floor=64):
+        self.cap = cap
+        self.percentile = percentile
+        self.margin = margin
+        self.warmup = warmup
+        self.floor = floor
+        self.lengths = []
+
+    def observe(self, n_tokens):
+        self.lengths.append(n_tokens)
+
+    @property
+    def value(self):
+        if len(self.lengths) < self.warmup:
+            return self.cap
+        ordered = sorted(self.lengths)
+        rank = min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(self.floor, min(self.cap, ordered[rank] + self.margin))
+
+
+class AuditEngine:
+    def __init__(self, model_path, device=0, batch_size=8, max_batch_tokens=None,
+                 max_new_tokens=512, budget=None, precision="fp32", greedy=False,
+                 draft_model=None, prompt_lookup=None, draft_tokens=None, adapters=None):
+        if draft_model and prompt_lookup:
+            raise ValueError("use either a draft model or prompt lookup, not both")
+        if adapters and precision in ("int8", "int4"):
+            raise ValueError("--adapters needs fp32 or bf16 weights")
+        self.device = resolve_device(device)
+        self.speculative = bool(draft_model or prompt_lookup)
+        if self.speculative and batch_size > 1:
+            # transformers runs assisted generation one sequence at a time.
+            print(f"Speculative decoding generates one user at a time; ignoring --batch_size {batch_size}")
+            batch_size = 1
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.precision = precision
+        self.model = load_model(model_path, self.device, precision)
+        self.adapters = list(adapters or {})
+        self.adapter = None
+        if adapters:
+            self.model = load_adapters(self.model, adapters).to(self.device)
+            self.adapter = self.adapters[0]
+        self.model.eval()
+
+        self.gen_kwargs = {
+            "max_new_tokens": max_new_tokens,
+            **decoding(greedy),
+            "pad_token_id": self.tokenizer.pad_token_id,
+            # Finish each row as soon as its answer tag closes, even inside a batch.
+            "stop_strings": [ANSWER_END],
+        }
+        self.budget = budget
+
+        # Speculative decoding: a smaller draft model (same tokenizer) or n-gram lookup in the
+        # prompt proposes tokens that the audit model verifies in one forward pass. Greedy
+        # decoding then returns the same tokens as without drafting; sampling keeps the distribution.
+        self.spec_kwargs = {}
+        if draft_model:
+            draft = load_model(draft_model, self.device, precision)
+            draft.eval()
+            if draft_tokens:
+                draft.generation_config.num_assistant_tokens = draft_tokens
+            self.spec_kwargs["assistant_model"] = draft
+        elif prompt_lookup:
+            self.spec_kwargs["prompt_lookup_num_tokens"] = prompt_lookup
+        if self.speculative:
+            # stop_strings would be handed on to the draft model's generate() without a tokenizer.
+            self.spec_kwargs["stopping_criteria"] = StoppingCriteriaList([StopStringCriteria(self.tokenizer, [ANSWER_END])])
+        self.draft_stats = {"target_steps": 0, "draft_tokens": 0}
+
+        self.prefix_ids = None
+        self.prefix_cache = None
+        self._prefixes = {}
+
+        self.answer_ids = self.tokenizer(ANSWER_PREFIX, add_special_tokens=False)["input_ids"]
+        self.real_id = self.tokenizer("Real", add_special_tokens=False)["input_ids"][0]
+        self.fake_id = self.tokenizer("Fake", add_special_tokens=False)["input_ids"][0]
+
+    def render(self, prompt):
+        return self.tokenizer.apply_chat_template(
+            [{"role": "user", "content": prompt}],
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+    def encode(self, prompts):
+        input_ids = []
+        for i, p in enumerate(prompts):
+            with tracing.span("tokenize", "engine", prompt=i):
+                input_ids.append(self.tokenizer(self.render(p), add_special_tokens=False)["input_ids"])
+        return input_ids
+
+    @torch.no_grad()
+    def set_prefix(self, header):
+        # Encode the chat-rendered prompt up to the end of the shared header once
+        # and keep its KV cache; later batches only prefill the per-user suffix.
+        rendered = self.render(header)
+        prefix_text = rendered[:rendered.index(header) + len(header)]
+        self.prefix_ids = self.tokenizer(prefix_text, add_special_tokens=False)["input_ids"]
+        input_ids = torch.tensor([self.prefix_ids], device=self.device)
+        with tracing.span("prefix", "engine", tokens=len(self.prefix_ids)):
+            self.prefix_cache = self.model(input_ids=input_ids, use_cache=True).past_key_values
+
+    def clear_prefix(self):
+        self.prefix_ids = None
+        self.prefix_cache = None
+
+    def set_adapter(self, name):
+        # None runs the plain base model. The shared-header KV cache depends on the adapter
+        # weights, so each adapter keeps its own.
+        if name == self.adapter:
+            return
+        if name is not None and name not in self.adapters:
+            raise ValueError(f"no adapter {name!r} loaded, have {self.adapters}")
+        self._prefixes[self.adapter] = (self.prefix_ids, self.prefix_cache)
+        if name is None:
+            self.model.base_model.disable_adapter_layers()
+        else:
+            if self.adapter is None:
+                self.model.base_model.enable_adapter_layers()
+            self.model.set_adapter(name)
+        self.adapter = name
+        self.prefix_ids, self.prefix_cache = self._prefixes.get(name, (None, None))
+
+    def uses_prefix(self, batch_ids):
+        if self.prefix_cache is None:
+            return False
+        n = len(self.prefix_ids)
+        # A token merge across the header boundary changes the ids; fall back to a full prefill.
+        return all(len(ids) > n and ids[:n] == self.prefix_ids for ids in batch_ids)
+
+    def _prepare_inputs(self, batch_ids):
+        if not self.uses_prefix(batch_ids):
+            inputs = self.tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt").to(self.device)
+            return dict(inputs)
+
+        n = len(self.prefix_ids)
+        suffix = self.tokenizer.pad({"input_ids": [ids[n:] for ids in batch_ids]}, return_tensors="pt").to(self.device)
+        batch = suffix["input_ids"].shape[0]
+        prefix = torch.tensor([self.prefix_ids], device=self.device).expand(batch, -1)
+
+        cache = copy.deepcopy(self.prefix_cache)
+        if batch > 1:
+            cache.batch_repeat_interleave(batch)
+
+        # Padding sits between the shared prefix and each suffix; position ids are
+        # derived from the attention mask, so every suffix continues at position n.
+        return {
+            "input_ids": torch.cat([prefix, suffix["input_ids"]], dim=1),
+            "attention_mask": torch.cat([torch.ones_like(prefix), suffix["attention_mask"]], dim=1),
+            "past_key_values": cache,
+        }
+
+    @torch.no_grad()
+    def prefill_batch(self, batch_ids, **kwargs):
+        inputs = self._prepare_inputs(batch_ids)
+        attention_mask = inputs["attention_mask"]
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        past = inputs.get("past_key_values")
+        start = past.get_seq_length() if past is not None else 0
+        return self.model(
+            input_ids=inputs["input_ids"][:, start:],
+            attention_mask=attention_mask,
+            position_ids=position_ids[:, start:],
+            past_key_values=past,
+            use_cache=True,
+            **kwargs
+        )
+
+    def score_batch(self, batch_ids):
+        # Logit margin log P(Fake) - log P(Real) at the forced answer position.
+        with tracing.span("score", "engine", users=len(batch_ids), prompt_tokens=sum(map(len, batch_ids))):
+            output = self.prefill_batch([ids + self.answer_ids for ids in batch_ids], logits_to_keep=1)
+            logits = output.logits[:, -1].float()
+            return (logits[:, self.fake_id] - logits[:, self.real_id]).tolist()
+
+    @torch.no_grad()
+    def generate_batch(self, batch_ids, max_new_tokens=None, streamer=None):
+        inputs = self._prepare_inputs(batch_ids)
+        gen_kwargs = dict(self.gen_kwargs)
+        if max_new_tokens is not None:
+            gen_kwargs["max_new_tokens"] = max_new_tokens
+        if self.speculative:
+            del gen_kwargs["stop_strings"]
+            gen_kwargs.update(self.spec_kwargs)
+            streamer = DraftCounter(streamer)
+        if streamer is not None:
+            gen_kwargs["streamer"] = streamer
+        with tracing.span("generate", "engine", users=len(batch_ids), prompt_tokens=sum(map(len, batch_ids)),
+                          max_new_tokens=gen_kwargs["max_new_tokens"]):
+            with tracing.profiled():
+                output = self.model.generate(**inputs, **gen_kwargs, tokenizer=self.tokenizer)
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        if self.speculative:
+            # Stopping is only checked once per accepted chunk, which may run past the stop
+            # string or the token cap; cut back to where token-by-token decoding stops and
+            # count only the steps and draft tokens behind the output that is kept.
+            new_tokens = self._trim_to_stop(new_tokens[:, :gen_kwargs["max_new_tokens"]])
+            steps, drafted = streamer.count(new_tokens.shape[1])
+            self.draft_stats["target_steps"] += steps
+            self.draft_stats["draft_tokens"] += drafted
+        lengths = (new_tokens != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        with tracing.span("decode_text", "engine", users=len(batch_ids)):
+            texts = [text.strip() for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+        return list(zip(texts, lengths))
+
+    def _trim_to_stop(self, new_tokens):
+        # Shortest prefix whose text contains the stop string; containment grows with the
+        # prefix, so a binary search needs only a few decodes.
+        tokens = new_tokens[0].tolist()
+        if ANSWER_END not in self.tokenizer.decode(tokens):
+            return new_tokens
+        low, high = 1, len(tokens)
+        while low < high:
+            mid = (low + high) // 2
+            if ANSWER_END in self.tokenizer.decode(tokens[:mid]):
+                high = mid
+            else:
+                low = mid + 1
+        return new_tokens[:, :low]
+
+    def generate_with_budget(self, batch_ids):
+        cap = self.gen_kwargs["max_new_tokens"]
+        limit = self.budget.value if self.budget is not None else cap
+        drafted = dict(self.draft_stats)
+        responses = self.generate_batch(batch_ids, limit)
+
+        # Rows cut off by a tightened budget are regenerated with the full cap.
+        retry = [j for j, (text, n) in enumerate(responses) if limit < cap and n >= limit and ANSWER_END not in text]
+        # Tokens of the cut-off first attempt; they count against the savings of the retried rows.
+        wasted = {j: responses[j][1] for j in retry}
+        if retry:
+            for j, res in zip(retry, self.generate_batch([batch_ids[j] for j in retry], cap)):
+                responses[j] = res
+
+        if self.budget is not None:
+            for j, (text, n) in enumerate(responses):
+                self.budget.observe(n if ANSWER_END in text else cap)
+
+        infos = []
+        for j, (text, n) in enumerate(responses):
+            generated = n + wasted.get(j, 0)
+            infos.append({
+                "prompt_tokens": len(batch_ids[j]),
+                "generated_tokens": generated,
+                "budget": cap if j in retry else limit,
+                "saved_tokens": cap - generated,
+            })
+        if self.speculative:
+            # One user per batch, so the counters since the start of the batch belong to it.
+            infos[0]["target_steps"] = self.draft_stats["target_steps"] - drafted["target_steps"]
+            infos[0]["draft_tokens"] = self.draft_stats["draft_tokens"] - drafted["draft_tokens"]
+        return [text for text, _ in responses], infos
+
+    def batches(self, input_ids, reserve_tokens=None):
+        if reserve_tokens is None:
+            reserve_tokens = self.gen_kwargs["max_new_tokens"]
+        return make_batches(
+            [len(ids) for ids in input_ids],
+            self.batch_size,
+            self.max_batch_tokens,
+            reserve_tokens=reserve_tokens
+        )
+
+    def run(self, prompts):
+        input_ids = self.encode(prompts)
+        for batch in self.batches(input_ids):
+            start = time.perf_counter()
+            try:
+                responses, infos = self.generate_with_budget([input_ids[i] for i in batch])
+            except Exception as e:
+                responses = [f"Error: {e}"] * len(batch)
+                infos = [{"prompt_tokens": len(input_ids[i]), "generated_tokens": 0} for i in batch]
+            # Wall time of the batch the user was generated in.
+            latency = time.perf_counter() - start
+            for idx, res, info in zip(batch, responses, infos):
+                info["latency_s"] = latency
+                yield idx, res, info
+
+    def score(self, prompts, scale=1.0, bias=0.0):
+        # P(fake) = sigmoid(scale * margin + bias); the defaults are the plain
+        # two-way softmax over the Real/Fake logits. Returns (margin, p_fake, latency_s, error);
+        # users of a batch that raised get (None, None, latency_s, "Error: ...").
+        input_ids = self.encode(prompts)
+        scores = [None] * len(prompts)
+        for batch in self.batches([ids + self.answer_ids for ids in input_ids], reserve_tokens=0):
+            start = time.perf_counter()
+            try:
+                margins = self.score_batch([input_ids[i] for i in batch])
+            except Exception as e:
+                latency = time.perf_counter() - start
+                for idx in batch:
+                    scores[idx] = (None, None, latency, f"Error: {e}")
+                continue
+            latency = time.perf_counter() - start
+            for idx, margin in zip(batch, margins):
+                scores[idx] = (margin, sigmoid(scale * margin + bias), latency, None)
+        return scores
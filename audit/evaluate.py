@@ -0,0 +1,204 @@
+import os
+import json
+import glob
+import argparse
+from itertools import islice
+
+import numpy as np
+
+from result_writer import user_label, extract_verdict
+
+SCORE_BINS = 10000
+CHUNK_SIZE = 4096
+DATASETS = ["Clothing", "MIND", "ml-1M"]
+
+
+def iter_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line of an interrupted run.
+                continue
+
+
+def iter_txt(path):
+    # Legacy .txt logs: a "User: <id>" line opens a block that runs until the next one.
+    user_id = None
+    block = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("User:"):
+                if user_id is not None:
+                    yield {"user_id": user_id, "verdict": extract_verdict("\n".join(block))}
+                user_id = line[len("User:"):].strip()
+                block = []
+            else:
+                block.append(line)
+    if user_id is not None:
+        yield {"user_id": user_id, "verdict": extract_verdict("\n".join(block))}
+
+
+def record_label(record):
+    # Records carry their label; legacy .txt blocks only have the user id.
+    return record["label"] if "label" in record else user_label(record["user_id"])
+
+
+def attack_name(path):
+    # ".../BandwagonAttack_ml-1M_unpopular_..." -> "BandwagonAttack (ml-1M)"; ".../MIND/GOAT" -> "GOAT (MIND)".
+    # The dataset comes from the file name when it names one, else from the results directory.
+    parts = os.path.splitext(os.path.basename(path))[0].split('_')
+    dataset = next((p for p in parts[1:] if p in DATASETS), os.path.basename(os.path.dirname(os.path.abspath(path))))
+    return f"{parts[0]} ({dataset})"
+
+
+class Metrics:
+    # Constant-size accumulator: a 2x2 confusion matrix (rows = label, cols = verdict;
+    # fake is the positive class) and per-class score histograms for ROC-AUC.
+    def __init__(self):
+        self.confusion = np.zeros((2, 2), dtype=np.int64)
+        self.unparsed = 0
+        self.pos_hist = np.zeros(SCORE_BINS, dtype=np.int64)
+        self.neg_hist = np.zeros(SCORE_BINS, dtype=np.int64)
+
+    def update(self, labels, preds, scores):
+        parsed = preds >= 0
+        self.unparsed += int((~parsed).sum())
+        labels, preds, scores = labels[parsed], preds[parsed], scores[parsed]
+
+        self.confusion += np.bincount(labels * 2 + preds, minlength=4).reshape(2, 2)
+        bins = np.minimum((scores * SCORE_BINS).astype(np.int64), SCORE_BINS - 1)
+        self.pos_hist += np.bincount(bins[labels == 1], minlength=SCORE_BINS)
+        self.neg_hist += np.bincount(bins[labels == 0], minlength=SCORE_BINS)
+
+    def merge(self, other):
+        self.confusion += other.confusion
+        self.unparsed += other.unparsed
+        self.pos_hist += other.pos_hist
+        self.neg_hist += other.neg_hist
+
+    def auc(self):
+        n_pos, n_neg = self.pos_hist.sum(), self.neg_hist.sum()
+        if not n_pos or not n_neg:
+            return None
+        # Sweep thresholds from high to low scores; trapezoids count ties within a bin as 1/2.
+        tpr = np.concatenate([[0.0], np.cumsum(self.pos_hist[::-1]) / n_pos])
+        fpr = np.concatenate([[0.0], np.cumsum(self.neg_hist[::-1]) / n_neg])
+        return float(np.sum((fpr[1:] - fpr[:-1]) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def summary(self):
+        (tn, fp), (fn, tp) = self.confusion.tolist()
+        total = tn + fp + fn + tp
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        return {
+            "users": total,
+            "unparsed": self.unparsed,
+            "confusion": {"real_pred_real": tn, "real_pred_fake": fp, "fake_pred_real": fn, "fake_pred_fake": tp},
+            "real_accuracy": tn / (tn + fp) if tn + fp else 0.0,
+            "fake_accuracy": recall,
+            "accuracy": (tn + tp) / total if total else 0.0,
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            "roc_auc": self.auc(),
+        }
+
+
+def evaluate_file(path, threshold=None):
+    metrics = Metrics()
+    records = iter_jsonl(path) if path.endswith('.jsonl') else iter_txt(path)
+    while True:
+        chunk = list(islice(records, CHUNK_SIZE))
+        if not chunk:
+            break
+        labels = np.fromiter((record_label(r) == 'fake' for r in chunk), dtype=np.int64, count=len(chunk))
+        verdicts = np.fromiter(
+            ({'real': 0, 'fake': 1}.get(r.get("verdict"), -1) for r in chunk), dtype=np.int64, count=len(chunk)
+        )
+        # Score-mode records carry P(fake); generated verdicts count as a hard 0/1 score.
+        scores = np.fromiter(
+            (r["p_fake"] if r.get("p_fake") is not None else float(v == 1) for r, v in zip(chunk, verdicts)),
+            dtype=np.float64, count=len(chunk)
+        )
+        if threshold is not None:
+            has_score = np.fromiter((r.get("p_fake") is not None for r in chunk), dtype=bool, count=len(chunk))
+            verdicts = np.where(has_score, (scores >= threshold).astype(np.int64), verdicts)
+        metrics.update(labels, verdicts, scores)
+    return metrics
+
+
+def result_files(out_dirs):
+    # Prefer structured .jsonl records; fall back to .txt logs of older runs.
+    for out_dir in out_dirs:
+        for path in sorted(glob.glob(os.path.join(out_dir, '**', '*.jsonl'), recursive=True)):
+            yield path
+        for path in sorted(glob.glob(os.path.join(out_dir, '**', '*.txt'), recursive=True)):
+            if os.path.basename(path) == 'summary_report.txt':
+                continue
+            if not os.path.exists(os.path.splitext(path)[0] + '.jsonl'):
+                yield path
+
+
+def write_block(f, name, summary):
+    c = summary["confusion"]
+    total_real = c["real_pred_real"] + c["real_pred_fake"]
+    total_fake = c["fake_pred_real"] + c["fake_pred_fake"]
+    correct = c["real_pred_real"] + c["fake_pred_fake"]
+    auc = f"{summary['roc_auc']:.4f}" if summary["roc_auc"] is not None else "n/a"
+    f.write(f"{name}\n")
+    f.write(f"Real Users Accuracy: {summary['real_accuracy'] * 100:.2f}% ({c['real_pred_real']} / {total_real})\n")
+    f.write(f"Fake Users Accuracy: {summary['fake_accuracy'] * 100:.2f}% ({c['fake_pred_fake']} / {total_fake})\n")
+    f.write(f"Overall Accuracy: {summary['accuracy'] * 100:.2f}% ({correct} / {summary['users']})\n")
+    f.write(f"Precision: {summary['precision']:.4f}  Recall: {summary['recall']:.4f}  "
+            f"F1: {summary['f1']:.4f}  ROC-AUC: {auc}\n")
+    if summary["unparsed"]:
+        f.write(f"Unparsed answers: {summary['unparsed']}\n")
+    f.write("=" * 60 + "\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming evaluation of audit_users.py results")
+    parser.add_argument("--out_dir", type=str, nargs='+', required=True,
+                        help="One or more directories with .jsonl results (searched recursively)")
+    parser.add_argument("--report", type=str, default=None,
+                        help="Text report path (default: <first out_dir>/summary_report.txt); a .json summary is written next to it")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Re-threshold P(fake) of score-mode records instead of using the stored verdict")
+    parser.add_argument("--per_file", action="store_true", help="Also report every result file")
+    args = parser.parse_args()
+
+    per_file = {}
+    per_attack = {}
+    overall = Metrics()
+    for path in result_files(args.out_dir):
+        metrics = evaluate_file(path, args.threshold)
+        if args.per_file:
+            per_file[path] = metrics.summary()
+        per_attack.setdefault(attack_name(path), Metrics()).merge(metrics)
+        overall.merge(metrics)
+
+    report_path = args.report or os.path.join(args.out_dir[0], 'summary_report.txt')
+    summary = {
+        "files": per_file,
+        "attacks": {name: m.summary() for name, m in sorted(per_attack.items())},
+        "overall": overall.summary(),
+    }
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        for path, s in per_file.items():
+            write_block(f, f"File: {path}", s)
+        for name, s in summary["attacks"].items():
+            write_block(f, f"Attack: {name}", s)
+        write_block(f, "Overall", summary["overall"])
+
+    with open(os.path.splitext(report_path)[0] + '.json', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n 结果保存在：{report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import argparse
+from collections import Counter
+
+from audit_users import add_engine_args, build_prompt, load_calibration, make_engine, make_run_fn
+from prescreen import item_categories, item_key
+from result_writer import extract_verdict
+
+
+def category_drift(before, after):
+    # Total variation distance between two category count distributions, in [0, 1].
+    n_before, n_after = sum(before.values()), sum(after.values())
+    if not n_before or not n_after:
+        return 1.0 if n_before or n_after else 0.0
+    return 0.5 * sum(abs(before.get(c, 0) / n_before - after.get(c, 0) / n_after) for c in set(before) | set(after))
+
+
+def read_events(path, offset, max_events, end=None):
+    # Complete lines after `offset` (and before `end`); a line still being appended is left for
+    # the next read. Malformed lines are reported and skipped so one bad event cannot block the stream.
+    events = []
+    if not os.path.exists(path):
+        return events, offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while len(events) < max_events and (end is None or offset < end):
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                if not isinstance(event, dict) or "user_id" not in event or not isinstance(event.get("item"), dict):
+                    raise ValueError("expected {\"user_id\": ..., \"item\": {...}}")
+            except ValueError as e:
+                print(f"Skipping malformed event at byte {start} of {path}: {e}", flush=True)
+                continue
+            events.append(event)
+    return events, offset
+
+
+# Per-user fields set by re-audits; everything else is rebuilt by replaying the events.
+AUDIT_FIELDS = ["new_items", "pending", "audited_categories", "verdict", "p_fake", "audited_at"]
+
+
+class IncrementalAuditor:
+    # Keeps every user's history together with the verdict and category counts of its last
+    # audit. Events are applied in micro-batches; afterwards only users whose history changed
+    # materially are re-audited:
+    #   new_user  - never audited and at least `min_history` items
+    #   new_items - at least `min_new_items` items since the last audit
+    #   drift     - category distribution moved by at least `drift` (total variation) since the last audit
+    # Verdict changes go to an append-only changelog. After each batch only the event offset and
+    # the audit fields of the users it touched are appended to a journal; the full state is
+    # snapshotted every `snapshot_every` batches, and on restart the journal is applied on top of
+    # the snapshot by replaying the events up to each recorded offset.
+    def __init__(self, dataset, run_fn, state_path, changelog_path, events_path, min_new_items=5, drift=0.2,
+                 min_history=5, max_history=None, snapshot_every=100):
+        self.dataset = dataset
+        self.run_fn = run_fn
+        self.state_path = state_path
+        self.journal_path = state_path + ".journal"
+        self.events_path = events_path
+        self.min_new_items = min_new_items
+        self.drift = drift
+        self.min_history = min_history
+        self.max_history = max_history
+        self.snapshot_every = snapshot_every
+
+        self.offset = 0
+        self.users = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if state["dataset"] != dataset:
+                raise ValueError(f"{state_path} holds {state['dataset']} users, not {dataset}")
+            self.offset = state["offset"]
+            self.users = state["users"]
+        self.item_keys = {user_id: {item_key(item) for item in u["items"]} for user_id, u in self.users.items()}
+        self.journaled = self._replay_journal()
+        self.journal = open(self.journal_path, 'a')
+
+        os.makedirs(os.path.dirname(os.path.abspath(changelog_path)), exist_ok=True)
+        self.changelog = open(changelog_path, 'a')
+
+    def _replay_journal(self):
+        # Entries at or below the snapshot offset were already in it (a crash between the
+        # snapshot and the journal reset); a torn last entry is dropped.
+        if not os.path.exists(self.journal_path):
+            return 0
+        n = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = json.loads(line)
+                if entry["offset"] <= self.offset:
+                    continue
+                while self.offset < entry["offset"]:
+                    events, offset = read_events(self.events_path, self.offset, 10000, end=entry["offset"])
+                    if offset == self.offset:
+                        raise ValueError(f"{self.events_path} ends before offset {entry['offset']} in {self.journal_path}")
+                    self.apply(events)
+                    self.offset = offset
+                for user_id, fields in entry["users"].items():
+                    self._user(user_id).update(fields)
+                n += 1
+        return n
+
+    def _user(self, user_id):
+        if user_id not in self.users:
+            self.users[user_id] = {
+                "items": [], "categories": {}, "new_items": 0, "pending": False,
+                "audited_categories": None, "verdict": None, "p_fake": None, "audited_at": None,
+            }
+            self.item_keys[user_id] = set()
+        return self.users[user_id]
+
+    def apply(self, events):
+        touched = set()
+        for event in events:
+            user_id, item = str(event["user_id"]), event["item"]
+            user = self._user(user_id)
+            key = item_key(item)
+            if key in self.item_keys[user_id]:
+                continue
+            self.item_keys[user_id].add(key)
+            user["items"].append(item)
+            categories = user["categories"]
+            for cat in item_categories(self.dataset, item):
+                categories[cat] = categories.get(cat, 0) + 1
+            if self.max_history and len(user["items"]) > self.max_history:
+                # Prompts show the most recent items only.
+                old = user["items"].pop(0)
+                self.item_keys[user_id].discard(item_key(old))
+                for cat in item_categories(self.dataset, old):
+                    categories[cat] -= 1
+                    if not categories[cat]:
+                        del categories[cat]
+            user["new_items"] += 1
+            touched.add(user_id)
+        return touched
+
+    def trigger(self, user):
+        if user["audited_categories"] is None:
+            return "new_user" if len(user["items"]) >= self.min_history else None
+        if user["pending"]:
+            return "retry"
+        if user["new_items"] >= self.min_new_items:
+            return "new_items"
+        if user["new_items"] and category_drift(user["audited_categories"], user["categories"]) >= self.drift:
+            return "drift"
+        return None
+
+    def reaudit(self, user_ids):
+        due = [(user_id, reason) for user_id in sorted(user_ids) if (reason := self.trigger(self.users[user_id]))]
+        prompts = [build_prompt(self.dataset, self.users[user_id]["items"]) for user_id, _ in due]
+        changes = Counter()
+        now = time.time()
+        for idx, res, info in self.run_fn(prompts):
+            user_id, reason = due[idx]
+            user = self.users[user_id]
+            if res.startswith("Error:"):
+                user["pending"] = True
+                continue
+            verdict = extract_verdict(res)
+            if verdict is not None and verdict != user["verdict"]:
+                self.changelog.write(json.dumps({
+                    "time": now,
+                    "user_id": user_id,
+                    "from": user["verdict"],
+                    "to": verdict,
+                    "p_fake_before": user["p_fake"],
+                    "p_fake": info.get("p_fake"),
+                    "trigger": reason,
+                    "history_len": len(user["items"]),
+                    "offset": self.offset,
+                    "response": res,
+                }, ensure_ascii=False) + "\n")
+                changes["first" if user["verdict"] is None else "flips"] += 1
+            if verdict is not None:
+                user["verdict"] = verdict
+                user["p_fake"] = info.get("p_fake")
+            user.update({
+                "audited_categories": dict(user["categories"]),
+                "new_items": 0,
+                "pending": False,
+                "audited_at": now,
+            })
+        return Counter(reason for _, reason in due), changes
+
+    def save(self, touched):
+        # The changelog is synced first: after a crash the events since the last saved offset
+        # are replayed, which at worst repeats changelog entries but never loses one.
+        self.changelog.flush()
+        os.fsync(self.changelog.fileno())
+        self.journaled += 1
+        if self.journaled >= self.snapshot_every:
+            self.snapshot()
+            return
+        entry = {"offset": self.offset, "users": {u: {k: self.users[u][k] for k in AUDIT_FIELDS} for u in touched}}
+        self.journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def snapshot(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"dataset": self.dataset, "offset": self.offset, "users": self.users}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+        self.journal.truncate(0)
+        os.fsync(self.journal.fileno())
+        self.journaled = 0
+
+    def run(self, batch_events=1000, follow=False, poll_interval=1.0):
+        retry = {user_id for user_id, u in self.users.items() if u["pending"]}
+        while True:
+            events, offset = read_events(self.events_path, self.offset, batch_events)
+            if not events and offset == self.offset:
+                if not follow:
+                    # Failed audits stay pending in the state and are retried on the next run.
+                    break
+                if not retry:
+                    time.sleep(poll_interval)
+                    continue
+            touched = self.apply(events) | retry
+            self.offset = offset
+            reasons, changes = self.reaudit(touched)
+            retry = {user_id for user_id in touched if self.users[user_id]["pending"]}
+            self.save(touched)
+            detail = ", ".join(f"{reason} {n}" for reason, n in sorted(reasons.items())) or "none"
+            print(f"offset {self.offset}: {len(events)} events, {len(touched)} users changed, "
+                  f"re-audited {sum(reasons.values())} ({detail}), {changes['flips']} verdict flips, "
+                  f"{changes['first']} first verdicts", flush=True)
+            if retry and not events:
+                # Only failed audits are left; wait before trying them again.
+                time.sleep(poll_interval)
+
+    def close(self):
+        self.journal.close()
+        self.changelog.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Re-audit users incrementally from an append-only interaction event stream")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"],
+                        help="Item format of the events")
+    parser.add_argument("--events", type=str, required=True,
+                        help="JSONL file of {\"user_id\": ..., \"item\": {...}} events, items shaped like data4llm entries")
+    parser.add_argument("--state", type=str, required=True,
+                        help="JSON state snapshot: histories, last verdicts and the event offset reached; "
+                             "batches since the snapshot go to <state>.journal")
+    parser.add_argument("--changelog", type=str, required=True, help="JSONL file verdict changes are appended to")
+    add_engine_args(parser)
+    parser.add_argument("--min_history", type=int, default=5, help="Items before a new user is first audited")
+    parser.add_argument("--min_new_items", type=int, default=5, help="Re-audit after this many new items")
+    parser.add_argument("--drift", type=float, default=0.2,
+                        help="Re-audit when the category distribution moved this far (total variation distance)")
+    parser.add_argument("--max_history", type=int, default=None, help="Keep only the most recent N items per user")
+    parser.add_argument("--batch_events", type=int, default=1000, help="Events applied per micro-batch")
+    parser.add_argument("--snapshot_every", type=int, default=100,
+                        help="Rewrite the full state every N micro-batches; in between only a journal entry is appended")
+    parser.add_argument("--follow", action="store_true", help="Keep polling the events file for new lines")
+    parser.add_argument("--poll_interval", type=float, default=1.0, help="Seconds between polls with --follow")
+    return parser
+
+
+def main():
+    args = load_calibration(build_parser().parse_args())
+    engine = make_engine(args)
+    auditor = IncrementalAuditor(
+        args.dataset,
+        make_run_fn(engine, args),
+        args.state,
+        args.changelog,
+        args.events,
+        min_new_items=args.min_new_items,
+        drift=args.drift,
+        min_history=args.min_history,
+        max_history=args.max_history,
+        snapshot_every=args.snapshot_every
+    )
+    try:
+        auditor.run(batch_events=args.batch_events, follow=args.follow, poll_interval=args.poll_interval)
+    finally:
+        auditor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import json
+import glob
+import argparse
+from functools import lru_cache
+from collections.abc import Mapping
+
+import numpy as np
+
+# Catalog columns per dataset. The first column is the item key used for interning;
+# list-valued fields are stored JSON-encoded.
+COLUMNS = {
+    "ml-1M": ["movie_id", "name", "genres"],
+    "MIND": ["news_id", "category", "subcategory", "title", "abstract"],
+    "Clothing": ["asin", "title", "categories"],
+}
+JSON_COLUMNS = {"categories"}
+
+
+def item_key(dataset, item):
+    key = item.get(COLUMNS[dataset][0])
+    # Items without an id are interned by content.
+    return str(key) if key is not None else json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def write_strings(path, values):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(path + ".bin", "wb") as f:
+        for b in encoded:
+            f.write(b)
+    np.save(path + ".idx.npy", offsets)
+
+
+class StringColumn:
+    # UTF-8 blob plus an offsets array, both memory-mapped.
+    def __init__(self, path):
+        self.offsets = np.load(path + ".idx.npy", mmap_mode="r")
+        size = os.path.getsize(path + ".bin")
+        self.blob = np.memmap(path + ".bin", dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class CatalogItem(Mapping):
+    # Read-only dict view of one decoded catalog row; build_prompt and the pre-screen use it like the JSON dicts.
+    __slots__ = ("row",)
+
+    def __init__(self, row):
+        self.row = row
+
+    def __getitem__(self, name):
+        return self.row[name]
+
+    def __iter__(self):
+        return iter(self.row)
+
+    def __len__(self):
+        return len(self.row)
+
+
+class Catalog:
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, "catalog", "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.dataset = meta["dataset"]
+        self.names = meta["columns"]
+        self.columns = {name: StringColumn(os.path.join(store_dir, "catalog", name)) for name in self.names}
+        # Each unique row is sliced and JSON-decoded once, however many histories contain it
+        # and however often its fields are read.
+        self.item = lru_cache(maxsize=None)(self._item)
+
+    def __len__(self):
+        return len(self.columns[self.names[0]])
+
+    def value(self, index, name):
+        raw = self.columns[name][index]
+        return json.loads(raw) if name in JSON_COLUMNS else raw
+
+    def row(self, index):
+        return {name: self.value(index, name) for name in self.names}
+
+    def _item(self, index):
+        return CatalogItem(self.row(index))
+
+    def keys(self):
+        column = self.columns[self.names[0]]
+        return [column[i] for i in range(len(column))]
+
+
+class UserHistories(Mapping):
+    # user_id -> list of catalog items for one converted input file, backed by
+    # an offsets array and an int32 array of catalog indices.
+    def __init__(self, catalog, users_dir):
+        self.catalog = catalog
+        with open(os.path.join(users_dir, "user_ids.json"), "r") as f:
+            self.user_ids = json.load(f)
+        self.position = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.offsets = np.load(os.path.join(users_dir, "offsets.npy"), mmap_mode="r")
+        self.items = np.load(os.path.join(users_dir, "items.npy"), mmap_mode="r")
+
+    def indices(self, user_id):
+        i = self.position[user_id]
+        return self.items[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, user_id):
+        return [self.catalog.item(int(j)) for j in self.indices(user_id)]
+
+    def __iter__(self):
+        return iter(self.user_ids)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+class ItemStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.catalog = Catalog(store_dir)
+        self.dataset = self.catalog.dataset
+
+    def files(self):
+        return sorted(os.listdir(os.path.join(self.store_dir, "users")))
+
+    def users(self, file_stem):
+        return UserHistories(self.catalog, os.path.join(self.store_dir, "users", file_stem))
+
+
+def convert(dataset, data_dir, store_dir):
+    # Interns every item of every input file into one catalog and stores each file's
+    # histories as offsets + catalog indices. Re-running with new files extends the catalog.
+    names = COLUMNS[dataset]
+    catalog_dir = os.path.join(store_dir, "catalog")
+    os.makedirs(catalog_dir, exist_ok=True)
+
+    rows = {name: [] for name in names}
+    index = {}
+    if os.path.exists(os.path.join(catalog_dir, "meta.json")):
+        existing = Catalog(store_dir)
+        if existing.dataset != dataset:
+            raise ValueError(f"{store_dir} holds a {existing.dataset} catalog, not {dataset}")
+        for name in names:
+            column = existing.columns[name]
+            rows[name] = [column[i] for i in range(len(column))]
+        index = {key: i for i, key in enumerate(rows[names[0]])}
+        del existing
+
+    files = sorted(glob.glob(f'{data_dir}/*.json'))
+    interactions = 0
+    for file in files:
+        with open(file, 'r') as f:
+            data = json.load(f)
+
+        user_ids = list(data.keys())
+        offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        items = []
+        for u, user_id in enumerate(user_ids):
+            for item in data[user_id]:
+                key = item_key(dataset, item)
+                if key not in index:
+                    index[key] = len(index)
+                    rows[names[0]].append(key)
+                    for name in names[1:]:
+                        value = item.get(name, "N/A")
+                        rows[name].append(json.dumps(value, ensure_ascii=False) if name in JSON_COLUMNS else str(value))
+                items.append(index[key])
+            offsets[u + 1] = len(items)
+        interactions += len(items)
+
+        users_dir = os.path.join(store_dir, "users", os.path.splitext(os.path.basename(file))[0])
+        os.makedirs(users_dir, exist_ok=True)
+        np.save(os.path.join(users_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(users_dir, "items.npy"), np.asarray(items, dtype=np.int32))
+        with open(os.path.join(users_dir, "user_ids.json"), "w") as f:
+            json.dump(user_ids, f)
+
+    for name in names:
+        write_strings(os.path.join(catalog_dir, name), rows[name])
+    with open(os.path.join(catalog_dir, "meta.json"), "w") as f:
+        json.dump({"dataset": dataset, "columns": names, "items": len(index)}, f)
+
+    return len(files), interactions, len(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert data4llm JSON files into a columnar item catalog and user-history store")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"])
+    parser.add_argument("--data_dir", type=str, required=True, help="Path to input JSON files")
+    parser.add_argument("--store_dir", type=str, required=True, help="Output store directory (shared across attack files)")
+    args = parser.parse_args()
+
+    n_files, interactions, n_items = convert(args.dataset, args.data_dir, args.store_dir)
+    print(f"Converted {n_files} files: {interactions} interactions over {n_items} unique items -> {args.store_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import copy
+import argparse
+
+from audit_users import (
+    DATASETS, add_engine_args, add_run_args, audit, load_calibration, make_engine, make_run_fn, parse_adapters
+)
+
+
+def dataset_args(args, dataset):
+    # The per-dataset view of the run: audit_users.audit() arguments for one data directory.
+    ds_args = copy.copy(args)
+    ds_args.dataset = dataset
+    ds_args.data_dir = os.path.join(args.data_root, dataset)
+    ds_args.store_dir = None
+    ds_args.out_dir = os.path.join(args.out_dir, dataset)
+    for name in ("trace", "profile"):
+        path = getattr(args, name)
+        if path:
+            root, ext = os.path.splitext(path)
+            setattr(ds_args, name, f"{root}_{dataset}{ext}")
+    return ds_args
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Audit several datasets with one base model, switching to each dataset's LoRA adapter"
+    )
+    parser.add_argument("--datasets", type=str, nargs='+', default=None, choices=DATASETS,
+                        help="Datasets to audit (default: those given in --adapters)")
+    parser.add_argument("--data_root", type=str, default="./data4llm", help="Holds one directory of JSON files per dataset")
+    parser.add_argument("--out_dir", type=str, required=True, help="Outputs go to <out_dir>/<dataset>")
+    add_engine_args(parser)
+    add_run_args(parser)
+    args = load_calibration(parser.parse_args())
+    datasets = args.datasets or list(parse_adapters(args.adapters))
+    if not datasets:
+        parser.error("nothing to audit: pass --datasets and/or --adapters")
+
+    # Base weights are loaded once; make_engine also builds one prefix cache per adapter.
+    args.dataset = datasets[0]
+    engine = make_engine(args)
+    run_fn = make_run_fn(engine, args)
+    for dataset in datasets:
+        ds_args = dataset_args(args, dataset)
+        if not os.path.isdir(ds_args.data_dir):
+            print(f"Skipping {dataset}: {ds_args.data_dir} not found")
+            continue
+        engine.set_adapter(dataset if dataset in engine.adapters else None)
+        print(f"Auditing {dataset} with {'adapter ' + dataset if engine.adapter else 'the base model'}")
+        audit(ds_args, run_fn)
+
+
+if __name__ == "__main__":
+    main()
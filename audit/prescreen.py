@@ -0,0 +1,234 @@
+import os
+import json
+import glob
+import argparse
+
+import numpy as np
+
+from result_writer import user_label
+
+FEATURES = ["n_items", "n_categories", "coverage", "entropy", "top1_share", "top3_share", "mean_popularity", "gender_mix"]
+
+# ml-1M has 18 genres; for the other datasets coverage is relative to the categories seen in the file.
+TOTAL_CATEGORIES = {"ml-1M": 18}
+
+FEMALE = {"Women", "Girls"}
+MALE = {"Men", "Boys"}
+
+# Conservative defaults built from the build_prompt guidelines: settle only users far from
+# what injected profiles look like and send everything else to the LLM. Defaults never
+# return fake; prescreen_rules_example.json shows an opt-in fake rule for --prescreen_rules.
+DEFAULT_RULES = {
+    "ml-1M": [
+        {"name": "narrow_genres", "verdict": "real", "when": [["n_categories", "<=", 6]]},
+    ],
+    "MIND": [
+        {"name": "dominant_topic", "verdict": "real", "when": [["top1_share", ">=", 0.6]]},
+        {"name": "few_topics", "verdict": "real", "when": [["n_categories", "<=", 5]]},
+    ],
+    "Clothing": [
+        {"name": "single_gender_focus", "verdict": "real", "when": [["gender_mix", "==", 0], ["top1_share", ">=", 0.8]]},
+    ],
+}
+
+OPS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+def clothing_categories(item):
+    return [
+        cat.replace('Clothing, Shoes & Jewelry', '').strip(', ').strip()
+        for cat in item.get('categories', []) if isinstance(cat, str)
+    ]
+
+
+def item_categories(dataset, item):
+    if dataset == "ml-1M":
+        return item.get('genres', 'N/A').split('|')
+    if dataset == "MIND":
+        return [item.get('category', 'N/A')]
+    cats = [cat for cat in clothing_categories(item) if cat]
+    return cats[:1] or ['N/A']
+
+
+def item_key(item):
+    for field in ("movie_id", "news_id", "asin"):
+        if field in item:
+            return item[field]
+    return item.get('title', item.get('name'))
+
+
+def item_gender(item):
+    parts = {part.strip() for cat in clothing_categories(item) for part in cat.split(',')}
+    return (1 if parts & FEMALE else 0), (1 if parts & MALE else 0)
+
+
+def compute_features(dataset, histories):
+    # One row per user; all features come from flat interaction arrays with NumPy reductions.
+    n_users = len(histories)
+    cat_index = {}
+    item_index = {}
+    cat_users, cat_ids, item_users, item_ids = [], [], [], []
+    female, male = [], []
+    for u, items in enumerate(histories):
+        for item in items:
+            item_users.append(u)
+            item_ids.append(item_index.setdefault(item_key(item), len(item_index)))
+            for cat in item_categories(dataset, item):
+                cat_users.append(u)
+                cat_ids.append(cat_index.setdefault(cat, len(cat_index)))
+            if dataset == "Clothing":
+                f, m = item_gender(item)
+                female.append(f)
+                male.append(m)
+
+    cat_users = np.asarray(cat_users, dtype=np.int64)
+    cat_ids = np.asarray(cat_ids, dtype=np.int64)
+    item_users = np.asarray(item_users, dtype=np.int64)
+    item_ids = np.asarray(item_ids, dtype=np.int64)
+
+    counts = np.zeros((n_users, max(len(cat_index), 1)), dtype=np.float64)
+    np.add.at(counts, (cat_users, cat_ids), 1)
+    totals = counts.sum(axis=1)
+    safe_totals = np.maximum(totals, 1)
+    shares = counts / safe_totals[:, None]
+    logs = np.log(shares, out=np.zeros_like(shares), where=shares > 0)
+    ordered = np.sort(counts, axis=1)[:, ::-1]
+
+    n_items = np.bincount(item_users, minlength=n_users).astype(np.float64)
+    # Popularity: share of this file's users that interacted with the item.
+    pairs = np.unique(item_users * len(item_index) + item_ids) if len(item_ids) else item_ids
+    popularity = np.bincount(pairs % max(len(item_index), 1), minlength=len(item_index)) / max(n_users, 1)
+    pop_sum = np.bincount(item_users, weights=popularity[item_ids], minlength=n_users)
+
+    n_categories = (counts > 0).sum(axis=1).astype(np.float64)
+    features = {
+        "n_items": n_items,
+        "n_categories": n_categories,
+        "coverage": n_categories / TOTAL_CATEGORIES.get(dataset, max(len(cat_index), 1)),
+        "entropy": -(shares * logs).sum(axis=1),
+        "top1_share": ordered[:, 0] / safe_totals,
+        "top3_share": ordered[:, :3].sum(axis=1) / safe_totals,
+        "mean_popularity": pop_sum / np.maximum(n_items, 1),
+        "gender_mix": np.zeros(n_users),
+    }
+    if dataset == "Clothing" and item_users.size:
+        f = np.bincount(item_users, weights=np.asarray(female, dtype=np.float64), minlength=n_users)
+        m = np.bincount(item_users, weights=np.asarray(male, dtype=np.float64), minlength=n_users)
+        features["gender_mix"] = np.minimum(f, m) / np.maximum(f + m, 1)
+    return features
+
+
+def apply_cascade(features, rules):
+    # verdicts: 1 fake, 0 real, -1 left for the LLM; stages: index of the deciding rule or -1.
+    n = len(features["n_items"])
+    verdicts = np.full(n, -1, dtype=np.int64)
+    stages = np.full(n, -1, dtype=np.int64)
+    for i, rule in enumerate(rules):
+        mask = stages < 0
+        for feature, op, value in rule["when"]:
+            mask &= OPS[op](features[feature], value)
+        verdicts[mask] = 1 if rule["verdict"] == "fake" else 0
+        stages[mask] = i
+    return verdicts, stages
+
+
+def load_rules(dataset, path=None):
+    if path is None:
+        return DEFAULT_RULES[dataset]
+    with open(path, 'r') as f:
+        rules = json.load(f)
+    return rules.get(dataset, rules) if isinstance(rules, dict) else rules
+
+
+def format_prescreen(rule, features, i):
+    verdict = "Fake" if rule["verdict"] == "fake" else "Real"
+    detail = ", ".join(f"{feature}={features[feature][i]:.3g}" for feature, _, _ in rule["when"])
+    return f"Pre-screen: {rule['name']} ({detail})\n<answer>\n{verdict}\n</answer>"
+
+
+def load_llm_verdicts(path):
+    verdicts = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                verdicts[r["user_id"]] = r.get("verdict")
+    return verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistical pre-screen cascade report")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"])
+    parser.add_argument("--data_dir", type=str, required=True, help="Path to input JSON files")
+    parser.add_argument("--rules", type=str, default=None, help="JSON cascade rules (default: built-in rules)")
+    parser.add_argument("--llm_out_dir", type=str, default=None,
+                        help="LLM-only audit_users.py results (.jsonl) to measure the accuracy cost against")
+    parser.add_argument("--dump_features", type=str, default=None, help="Optional .json path for per-user features")
+    args = parser.parse_args()
+
+    rules = load_rules(args.dataset, args.rules)
+    stage_names = [r["name"] for r in rules] + ["llm"]
+    resolved = np.zeros(len(stage_names), dtype=np.int64)
+    correct = np.zeros(len(stage_names), dtype=np.int64)
+    llm_correct = np.zeros(len(stage_names), dtype=np.int64)
+    llm_seen = np.zeros(len(stage_names), dtype=np.int64)
+    dump = {}
+
+    for file in sorted(glob.glob(f'{args.data_dir}/*.json')):
+        with open(file, 'r') as f:
+            data = json.load(f)
+        user_ids = list(data.keys())
+        features = compute_features(args.dataset, [data[u] for u in user_ids])
+        verdicts, stages = apply_cascade(features, rules)
+        labels = np.array([user_label(u) == 'fake' for u in user_ids], dtype=np.int64)
+        stages = np.where(stages < 0, len(rules), stages)
+
+        llm = {}
+        if args.llm_out_dir:
+            file_stem = os.path.splitext(os.path.basename(file))[0]
+            llm = load_llm_verdicts(os.path.join(args.llm_out_dir, file_stem + '.jsonl'))
+        llm_pred = np.array([{'real': 0, 'fake': 1}.get(llm.get(u), -1) for u in user_ids], dtype=np.int64)
+
+        resolved += np.bincount(stages, minlength=len(stage_names))
+        correct += np.bincount(stages, weights=(verdicts == labels), minlength=len(stage_names)).astype(np.int64)
+        llm_seen += np.bincount(stages, weights=(llm_pred >= 0), minlength=len(stage_names)).astype(np.int64)
+        llm_correct += np.bincount(stages, weights=(llm_pred == labels), minlength=len(stage_names)).astype(np.int64)
+
+        if args.dump_features:
+            dump[file] = {u: {k: float(features[k][i]) for k in FEATURES} for i, u in enumerate(user_ids)}
+
+    total = int(resolved.sum())
+    print("=" * 60)
+    print(f"{'stage':<24}{'users':>8}{'share':>9}{'acc':>9}{'llm acc':>10}")
+    for i, name in enumerate(stage_names):
+        share = resolved[i] / total * 100 if total else 0
+        acc = f"{correct[i] / resolved[i] * 100:.2f}%" if i < len(rules) and resolved[i] else "-"
+        llm_acc = f"{llm_correct[i] / llm_seen[i] * 100:.2f}%" if llm_seen[i] else "-"
+        print(f"{name:<24}{resolved[i]:>8}{share:>8.1f}%{acc:>9}{llm_acc:>10}")
+    print("=" * 60)
+
+    screened = int(resolved[:-1].sum())
+    print(f"Resolved without the LLM: {screened} / {total}")
+    if llm_seen.sum() == total and total:
+        llm_only = llm_correct.sum() / total * 100
+        cascade = (correct[:-1].sum() + llm_correct[-1]) / total * 100
+        print(f"LLM-only accuracy: {llm_only:.2f}%")
+        print(f"Cascade accuracy:  {cascade:.2f}% ({cascade - llm_only:+.2f} points)")
+
+    if args.dump_features:
+        with open(args.dump_features, 'w') as f:
+            json.dump(dump, f)
+
+
+if __name__ == "__main__":
+    main()
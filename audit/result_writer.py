@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import time
+
+import tracing
+
+ANSWER_RE = re.compile(r'<answer>\s*(Real|Fake)\s*</answer>', re.IGNORECASE)
+
+
+def user_label(user_id):
+    # Injected users carry "fake" in their id (e.g. fakeUser12).
+    return 'fake' if 'fake' in str(user_id).lower() else 'real'
+
+
+def extract_verdict(text):
+    match = ANSWER_RE.search(text)
+    return match.group(1).lower() if match else None
+
+
+def format_block(user_id, res):
+    return f"User: {user_id}\n\n" + res + "\n" + "=" * 60 + "\n"
+
+
+def failed(record):
+    # Users of a batch that raised (see AuditEngine.run); --resume audits them again.
+    return record.get("verdict") is None and record["response"].startswith("Error:")
+
+
+def load_records(jsonl_path):
+    # Completed users of an earlier run; a torn last line from a crash is cut off.
+    records = []
+    if not os.path.exists(jsonl_path):
+        return records
+    valid_bytes = 0
+    with open(jsonl_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            valid_bytes += len(line)
+    if valid_bytes != os.path.getsize(jsonl_path):
+        with open(jsonl_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return records
+
+
+class ResultWriter:
+    # Writes the human-readable .txt log and a .jsonl record per user. The .jsonl
+    # file doubles as the progress manifest for --resume. Users are written as soon as they
+    # finish, in whatever order batches complete; when `order` (the file's user ids) is given,
+    # the .txt is rewritten in that order on close.
+    #
+    # durability:
+    #   always - flush and fsync after every user
+    #   batch  - flush and fsync every `commit_every` users or `commit_interval` seconds
+    #   none   - flush on the same schedule, leave syncing to the OS
+    def __init__(self, txt_path, jsonl_path, order=None, resume=False, durability="batch",
+                 commit_every=32, commit_interval=10.0, verbose=True):
+        self.txt_path = txt_path
+        self.order = order
+        self.durability = durability
+        self.commit_every = 1 if durability == "always" else commit_every
+        self.commit_interval = commit_interval
+        self.verbose = verbose
+
+        self.records = load_records(jsonl_path) if resume else []
+        if any(failed(r) for r in self.records):
+            self.records = [r for r in self.records if not failed(r)]
+            tmp = jsonl_path + ".tmp"
+            with open(tmp, 'w') as f:
+                for r in self.records:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, jsonl_path)
+        self.done = {r["user_id"] for r in self.records}
+
+        if resume:
+            # The .txt may hold users past the last committed record; rebuild it from the manifest.
+            with open(txt_path, 'w') as f:
+                for r in self.records:
+                    f.write(format_block(r["user_id"], r["response"]))
+            self.txt = open(txt_path, 'a')
+            self.jsonl = open(jsonl_path, 'a')
+        else:
+            self.txt = open(txt_path, 'w')
+            self.jsonl = open(jsonl_path, 'w')
+
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def write(self, user_id, res, info):
+        with tracing.span("write", "writer", user=user_id):
+            self._write(user_id, res, info)
+
+    def _write(self, user_id, res, info):
+        if self.verbose:
+            print(f"\nUser: {user_id}")
+            print(res)
+            if "saved_tokens" in info:
+                print(f"Tokens: generated {info['generated_tokens']}, budget {info['budget']}, saved {info['saved_tokens']}")
+            print("=" * 60)
+
+        record = {
+            "user_id": user_id,
+            "label": user_label(user_id),
+            "verdict": extract_verdict(res),
+            "response": res,
+            **info,
+        }
+        self.txt.write(format_block(user_id, res))
+        self.jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.records.append(record)
+        self.done.add(user_id)
+
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        # The .txt goes first so every committed record also has its log block.
+        with tracing.span("commit", "writer", users=self._uncommitted, fsync=self.durability != "none"):
+            for f in (self.txt, self.jsonl):
+                f.flush()
+                if self.durability != "none":
+                    os.fsync(f.fileno())
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self.txt.close()
+        self.jsonl.close()
+        if self.order is not None:
+            position = {user_id: i for i, user_id in enumerate(self.order)}
+            self.records.sort(key=lambda r: position.get(r["user_id"], len(position)))
+            tmp = self.txt_path + ".tmp"
+            with open(tmp, 'w') as f:
+                for r in self.records:
+                    f.write(format_block(r["user_id"], r["response"]))
+            os.replace(tmp, self.txt_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,265 @@
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audit_users import add_engine_args, build_prompt, load_calibration, make_engine, make_run_fn
+from result_writer import extract_verdict
+
+DATASETS = ["Clothing", "MIND", "ml-1M"]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AuditService:
+    # Requests wait in a bounded queue. A batch is dispatched when it holds `max_batch` users or
+    # when its oldest request has waited `max_wait` seconds; while the model works on one batch
+    # the next one fills up. The model runs on a single executor thread. With `select`, a batch
+    # of mixed datasets runs as one sub-batch per dataset, each after select(dataset)
+    # (e.g. switching to that dataset's adapter).
+    def __init__(self, run_fn, max_batch=8, max_wait=0.02, max_queue=256, window=2048, select=None):
+        self.run_fn = run_fn
+        self.select = select
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.worker = None
+
+        self.latencies = deque(maxlen=window)
+        self.queue_waits = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.started = time.monotonic()
+
+    def start(self):
+        self.worker = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def audit(self, dataset, items, user_id=None, wait=True):
+        if dataset not in DATASETS:
+            raise ValueError(f"unknown dataset {dataset!r}, expected one of {DATASETS}")
+        future = asyncio.get_running_loop().create_future()
+        request = (build_prompt(dataset, items), user_id, time.monotonic(), future, dataset)
+        if wait:
+            await self.queue.put(request)
+        else:
+            try:
+                self.queue.put_nowait(request)
+            except asyncio.QueueFull:
+                self.rejected += 1
+                raise QueueFull(f"audit queue is full ({self.queue.maxsize} pending)")
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        # The deadline counts from the oldest request, so users that queued up behind a
+        # running batch are dispatched without further waiting.
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                while len(batch) < self.max_batch and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _run_batch(self, batch):
+        results = [None] * len(batch)
+        groups = {}
+        for i, request in enumerate(batch):
+            groups.setdefault(request[4] if self.select else None, []).append(i)
+        for dataset, members in groups.items():
+            if self.select:
+                self.select(dataset)
+            for idx, res, info in self.run_fn([batch[i][0] for i in members]):
+                results[members[idx]] = (res, info)
+        return results
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            dispatched = time.monotonic()
+            self.in_flight = len(batch)
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self._run_batch, batch)
+            except Exception as e:
+                for _, _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.in_flight = 0
+
+            done = time.monotonic()
+            for (_, user_id, enqueued, future, _), (res, info) in zip(batch, results):
+                self.latencies.append(done - enqueued)
+                self.queue_waits.append(dispatched - enqueued)
+                self.completed += 1
+                if future.done():
+                    # The client went away (cancelled) while its batch was running.
+                    continue
+                result = {
+                    "user_id": user_id,
+                    "verdict": extract_verdict(res),
+                    "response": res,
+                    "queue_s": dispatched - enqueued,
+                    "latency_s": done - enqueued,
+                }
+                for key in ("p_fake", "margin", "generated_tokens"):
+                    if key in info:
+                        result[key] = info[key]
+                future.set_result(result)
+
+    def stats(self):
+        def percentiles(values):
+            if not values:
+                return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+            p50, p95, p99 = np.percentile(np.asarray(values), [50, 95, 99])
+            return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "users_per_s": self.completed / (time.monotonic() - self.started),
+            "latency_s": percentiles(self.latencies),
+            "queue_wait_s": percentiles(self.queue_waits),
+        }
+
+
+async def handle_connection(service, reader, writer, max_pending, reject_when_full):
+    # JSON lines in both directions. Requests on one connection are processed concurrently and
+    # answered as they finish, tagged with the request "id". At most `max_pending` requests per
+    # connection are outstanding; beyond that the server stops reading, which pushes back on the client.
+    lock = asyncio.Lock()
+    pending = asyncio.Semaphore(max_pending)
+    tasks = set()
+
+    async def reply(message):
+        async with lock:
+            writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    async def serve(request):
+        try:
+            if request.get("op") == "stats":
+                await reply({"id": request.get("id"), **service.stats()})
+                return
+            result = await service.audit(
+                request["dataset"], request["items"], request.get("user_id"), wait=not reject_when_full
+            )
+            await reply({"id": request.get("id"), **result})
+        except Exception as e:
+            # Bad requests, a full queue with --reject_when_full, or a failed batch.
+            await reply({"id": request.get("id") if isinstance(request, dict) else None, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            pending.release()
+
+    try:
+        while True:
+            await pending.acquire()
+            line = await reader.readline()
+            if not line:
+                pending.release()
+                break
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                pending.release()
+                await reply({"id": None, "error": f"invalid JSON: {e}"})
+                continue
+            task = asyncio.create_task(serve(request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        writer.close()
+
+
+async def serve_forever(args):
+    engine = make_engine(args)
+    service = AuditService(
+        make_run_fn(engine, args),
+        max_batch=args.batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_queue=args.max_queue,
+        # Mixed-dataset batches are split by adapter; datasets without one use the base model.
+        select=(lambda dataset: engine.set_adapter(dataset if dataset in engine.adapters else None))
+        if engine.adapters else None
+    )
+    service.start()
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(service, r, w, args.max_pending, args.reject_when_full),
+        args.host, args.port
+    )
+    port = server.sockets[0].getsockname()[1]
+    print(f"Audit service listening on {args.host}:{port} ({args.mode} mode, batch {args.batch_size}, "
+          f"max wait {args.max_wait_ms} ms, queue {args.max_queue})", flush=True)
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print(json.dumps(service.stats()), flush=True)
+
+    reporter = asyncio.create_task(report()) if args.stats_interval else None
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if reporter:
+            reporter.cancel()
+        await service.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Long-running audit service: JSON-lines requests over TCP, dynamic batching")
+    parser.add_argument("--dataset", type=str, default="ml-1M", choices=DATASETS,
+                        help="Dataset whose guideline header --prefix_cache encodes (every dataset with an adapter "
+                             "gets its own); requests may use any dataset")
+    add_engine_args(parser)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    parser.add_argument("--max_wait_ms", type=float, default=20.0,
+                        help="Longest time the oldest queued request waits for its batch to fill")
+    parser.add_argument("--max_queue", type=int, default=256, help="Queued requests before callers are held back")
+    parser.add_argument("--max_pending", type=int, default=64, help="Outstanding requests per connection")
+    parser.add_argument("--reject_when_full", action="store_true",
+                        help="Answer with an error instead of waiting when the queue is full")
+    parser.add_argument("--stats_interval", type=float, default=0, help="Print service stats every N seconds (0 = off)")
+    return parser
+
+
+def main():
+    args = load_calibration(build_parser().parse_args())
+    asyncio.run(serve_forever(args))
+
+
+if __name__ == "__main__":
+    main()
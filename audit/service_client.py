@@ -0,0 +1,72 @@
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+from result_writer import user_label
+
+
+async def run(args):
+    with open(args.data_file, 'r') as f:
+        data = json.load(f)
+    users = list(data.items())[:args.max_users]
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    window = asyncio.Semaphore(args.concurrency)
+    sent = {}
+    results = {}
+
+    async def receive():
+        while len(results) < len(users):
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("service closed the connection")
+            reply = json.loads(line)
+            results[reply["id"]] = (reply, time.monotonic() - sent[reply["id"]])
+            window.release()
+
+    receiver = asyncio.create_task(receive())
+    start = time.monotonic()
+    for i, (user_id, items) in enumerate(users):
+        await window.acquire()
+        sent[i] = time.monotonic()
+        writer.write((json.dumps({"id": i, "dataset": args.dataset, "user_id": user_id, "items": items}) + "\n").encode())
+        await writer.drain()
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    await receiver
+    elapsed = time.monotonic() - start
+
+    writer.write((json.dumps({"id": "stats", "op": "stats"}) + "\n").encode())
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+
+    errors = [r for r, _ in results.values() if "error" in r]
+    latencies = np.asarray([lat for _, lat in results.values()])
+    correct = sum(1 for i, (r, _) in results.items() if r.get("verdict") == user_label(users[i][0]))
+    print(f"Users: {len(users)} in {elapsed:.2f}s ({len(users) / elapsed:.2f} users/s), errors: {len(errors)}")
+    print(f"Client latency p50/p95/p99: " + " / ".join(f"{v:.3f}s" for v in np.percentile(latencies, [50, 95, 99])))
+    print(f"Accuracy vs. user id labels: {correct / len(users):.3f}")
+    if errors:
+        print(f"First error: {errors[0]['error']}")
+    print("Service stats:", json.dumps({k: v for k, v in stats.items() if k != "id"}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the users of one data4llm file to a running audit service")
+    parser.add_argument("--dataset", type=str, required=True, choices=["Clothing", "MIND", "ml-1M"])
+    parser.add_argument("--data_file", type=str, required=True, help="data4llm JSON file with user histories")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max_users", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second (0 = as fast as the window allows)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import queue
+import multiprocessing as mp
+
+from audit_users import audit, build_parser, make_engine, make_run_fn, parse_args
+
+
+def split_cores(n_workers):
+    cores = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cores) // n_workers)
+    return [cores[i * per_worker:(i + 1) * per_worker] or cores for i in range(n_workers)]
+
+
+def worker_main(worker_id, args, device, cores, tasks, results):
+    if cores:
+        os.sched_setaffinity(0, cores)
+    import torch
+    if device < 0 and cores:
+        torch.set_num_threads(len(cores))
+
+    # Each worker loads its own copy; safetensors checkpoints are memory-mapped, so
+    # unconverted weights share the page cache.
+    engine = make_engine(args, device=device)
+    run_fn = make_run_fn(engine, args)
+    results.put(("ready", worker_id, None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, items = task
+        sent = set()
+        try:
+            for j, res, info in run_fn([prompt for _, prompt in items]):
+                info["worker"] = worker_id
+                results.put((task_id, items[j][0], res, info))
+                sent.add(j)
+        except Exception as e:
+            # Anything already sent is kept by the parent; only the rest of the chunk is marked failed.
+            for j, (idx, _) in enumerate(items):
+                if j not in sent:
+                    results.put((task_id, idx, f"Error: {e}", {"generated_tokens": 0, "worker": worker_id}))
+        results.put(("done", worker_id, task_id, None))
+
+
+class WorkerPool:
+    # One model per worker process; users are handed out in chunks through a shared queue,
+    # so a worker that drew long histories does not hold the others up.
+    def __init__(self, args, n_workers, devices, chunk_size):
+        ctx = mp.get_context("spawn")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.chunk_size = chunk_size
+        self.next_task = 0
+
+        cores = split_cores(n_workers) if all(d < 0 for d in devices) else [None] * n_workers
+        self.workers = [
+            ctx.Process(
+                target=worker_main,
+                args=(i, args, devices[i % len(devices)], cores[i], self.tasks, self.results),
+                daemon=True
+            )
+            for i in range(n_workers)
+        ]
+        for w in self.workers:
+            w.start()
+        for _ in self.workers:
+            self._get()
+
+    def _get(self):
+        while True:
+            try:
+                return self.results.get(timeout=5)
+            except queue.Empty:
+                dead = [w.pid for w in self.workers if not w.is_alive()]
+                if dead:
+                    raise RuntimeError(f"audit worker(s) {dead} exited unexpectedly")
+
+    def run(self, prompts):
+        # Longest prompts are queued first so the tail of a file is made of short chunks.
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]), reverse=True)
+        received = {}
+        issued = set()
+        for start in range(0, len(order), self.chunk_size):
+            chunk = order[start:start + self.chunk_size]
+            self.tasks.put((self.next_task, [(i, prompts[i]) for i in chunk]))
+            issued.add(self.next_task)
+            self.next_task += 1
+
+        while len(received) < len(prompts):
+            task_id, idx, res, info = self._get()
+            # Messages of an earlier call (e.g. a previous file) refer to other users' indices.
+            if task_id not in issued or idx in received:
+                continue
+            received[idx] = True
+            yield idx, res, info
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for w in self.workers:
+            w.join(timeout=60)
+
+
+def main():
+    parser = build_parser()
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes")
+    parser.add_argument("--devices", type=int, nargs='+', default=None,
+                        help="Devices assigned round-robin to workers (-1 = CPU, cores are split between workers); "
+                             "defaults to --device")
+    parser.add_argument("--chunk_size", type=int, default=None,
+                        help="Users per work item handed to a worker (default: --batch_size)")
+    args = parse_args(parser)
+
+    pool = WorkerPool(
+        args,
+        n_workers=args.workers,
+        devices=args.devices or [args.device],
+        chunk_size=args.chunk_size or args.batch_size
+    )
+    try:
+        # The parent keeps the writer, verdict cache and pre-screen, so outputs merge in
+        # the original user order exactly as in a single-process run.
+        audit(args, pool.run)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+# Opt-in stage instrumentation. Code calls tracing.span("stage", **args) around work; until
+# start() is called this returns a shared no-op context, so the cost with tracing off is one
+# function call per span.
+
+_NULL = nullcontext()
+
+
+class NullTracer:
+    def span(self, name, cat="audit", **args):
+        return _NULL
+
+    def profiled(self):
+        return _NULL
+
+
+class Tracer:
+    def __init__(self, path, profile_path=None):
+        self.path = path
+        self.profile_path = profile_path
+        self.events = []
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.wall_start = time.time()
+        self.profiler = make_profiler() if profile_path else None
+
+    @contextmanager
+    def span(self, name, cat="audit", **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            # Chrome trace "complete" event; timestamps and durations in microseconds.
+            self.events.append({
+                "name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": threading.get_ident(),
+                "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "args": args,
+            })
+
+    @contextmanager
+    def profiled(self):
+        # Sampling profiler around generation only; the rest of the pipeline is covered by spans.
+        if self.profiler is None:
+            yield
+            return
+        self.profiler.start()
+        try:
+            yield
+        finally:
+            self.profiler.stop()
+
+    def export(self):
+        if self.path:
+            thread_names = [
+                {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": t.ident, "args": {"name": t.name}}
+                for t in threading.enumerate()
+            ]
+            with open(self.path, 'w') as f:
+                json.dump({
+                    "traceEvents": thread_names + self.events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"start_time": self.wall_start},
+                }, f)
+        if self.profiler is not None:
+            self.profiler.save(self.profile_path)
+
+    def summary(self):
+        durations = {}
+        for e in self.events:
+            durations.setdefault((e["cat"], e["name"]), []).append(e["dur"] / 1e6)
+        wall = time.perf_counter() - self.origin
+        rows = []
+        for (cat, name), values in durations.items():
+            values = np.asarray(values)
+            rows.append({
+                "cat": cat, "name": name, "count": len(values), "total_s": float(values.sum()),
+                "mean_ms": float(values.mean() * 1000), "p95_ms": float(np.percentile(values, 95) * 1000),
+                "max_ms": float(values.max() * 1000), "wall_pct": float(values.sum() / wall * 100) if wall else 0.0,
+            })
+        return sorted(rows, key=lambda r: r["total_s"], reverse=True), wall
+
+    def print_summary(self):
+        rows, wall = self.summary()
+        print("=" * 96)
+        print(f"{'stage':<28}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'% wall':>9}")
+        for r in rows:
+            print(f"{r['cat'] + '/' + r['name']:<28}{r['count']:>8}{r['total_s']:>10.3f}{r['mean_ms']:>10.2f}"
+                  f"{r['p95_ms']:>10.2f}{r['max_ms']:>10.2f}{r['wall_pct']:>9.1f}")
+        print(f"Traced wall time: {wall:.2f}s. Spans nest (file > batch > user), so percentages overlap across levels.")
+        print("=" * 96)
+
+
+class _PyinstrumentProfiler:
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(self.profiler.output_html() if path.endswith(".html") else self.profiler.output_text())
+
+
+class _CProfileProfiler:
+    # Fallback when pyinstrument is not installed: deterministic, higher overhead, pstats output.
+    def __init__(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        self.profiler.dump_stats(path)
+
+
+def make_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        print("pyinstrument not installed; profiling generation with cProfile instead")
+        return _CProfileProfiler()
+    return _PyinstrumentProfiler(Profiler())
+
+
+_tracer = NullTracer()
+
+
+def start(path, profile_path=None):
+    global _tracer
+    _tracer = Tracer(path, profile_path)
+    return _tracer
+
+
+def finish():
+    global _tracer
+    tracer, _tracer = _tracer, NullTracer()
+    if isinstance(tracer, Tracer):
+        tracer.export()
+        tracer.print_summary()
+    return tracer
+
+
+def span(name, cat="audit", **args):
+    return _tracer.span(name, cat, **args)
+
+
+def profiled():
+    return _tracer.profiled()
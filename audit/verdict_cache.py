@@ -0,0 +1,122 @@
+import os
+import glob
+import json
+import time
+import sqlite3
+import hashlib
+
+
+def model_fingerprint(model_path):
+    # Identity of a checkpoint: its config and chat template plus name, size and mtime
+    # of every weight file. Keys hash the raw prompt, so the template must be part of it.
+    h = hashlib.sha256()
+    for name in ("config.json", "tokenizer_config.json", "chat_template.jinja"):
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    weights = sorted(glob.glob(os.path.join(model_path, "*.safetensors")) + glob.glob(os.path.join(model_path, "*.bin")))
+    for path in weights:
+        st = os.stat(path)
+        h.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}".encode())
+    if not weights:
+        # Hub ids or unusual layouts: fall back to the name itself.
+        h.update(model_path.encode())
+    return h.hexdigest()
+
+
+def make_key(model_id, prompt, params):
+    payload = json.dumps({"model": model_id, "prompt": prompt, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    # SQLite in WAL mode: several audit processes can read and write the same file;
+    # writers wait on the database lock instead of failing.
+    def __init__(self, path, max_entries=None, max_bytes=None, evict_every=64):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS verdicts_last_access ON verdicts (last_access)")
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self.conn.execute(f"SELECT key, value FROM verdicts WHERE key IN ({marks})", chunk).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+            if rows:
+                self.conn.execute(
+                    f"UPDATE verdicts SET last_access = ? WHERE key IN ({','.join('?' * len(rows))})",
+                    [time.time()] + [key for key, _ in rows]
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO verdicts (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, data, len(data.encode("utf-8")), time.time())
+        )
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        if not self.max_entries and not self.max_bytes:
+            return 0
+        removed = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM verdicts").fetchone()
+            excess = count - self.max_entries if self.max_entries else 0
+            if excess > 0:
+                removed += self.conn.execute(
+                    "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                ).rowcount
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM verdicts").fetchone()[0]
+            # Drop least recently used entries until the payload fits the byte budget.
+            while self.max_bytes and total > self.max_bytes:
+                rows = self.conn.execute("SELECT key, size FROM verdicts ORDER BY last_access LIMIT 256").fetchall()
+                if not rows:
+                    break
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self.evict()
+        self.conn.close()
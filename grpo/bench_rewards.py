@@ -0,0 +1,130 @@
+import io
+import json
+import time
+import random
+import logging
+import argparse
+from contextlib import redirect_stdout
+
+import rewards
+import reward_engine
+
+REWARD_FUNCS = [
+    "user_reward_func",
+    "format_reward",
+    "format_bonus_reward",
+    "verbose_think_reward",
+    "consistency_reward",
+    "nonsense_penalty",
+]
+
+WORDS = ["the", "user", "watched", "drama", "comedy", "movies", "don't", "interest", "Real", "fake",
+         "genres", "pattern", "scattered", "consistent", "it's", "history", "profile", "news", "sports"]
+
+
+def synthetic_completion(rng):
+    n_words = rng.choice([0, 20, 59, 60, 61, 90, 129, 130, 131, 200])
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    if rng.random() < 0.1:
+        words.append("x" * rng.choice([20, 21, 30]))
+    think = " ".join(words)
+    if rng.random() < 0.3:
+        think = "\n".join(f"{i + 1}. {think[i * 20:(i + 1) * 20]}" for i in range(4))
+    label = rng.choice(["Real", "Fake", "real", "FAKE", "Maybe"])
+
+    form = rng.random()
+    if form < 0.5:
+        text = f"<think>\n{think}\n</think>\n<answer>\n{label}\n</answer>"
+    elif form < 0.65:
+        text = f"<THINK> {think} </Think><answer> {label} </answer>"
+    elif form < 0.75:
+        text = f"<think>{think}</think>\n<answer>\n{label}\n</answer>\n{think}"
+    elif form < 0.85:
+        text = f"{think}\n<answer>{label}</answer>"
+    elif form < 0.95:
+        text = f"<think>\n{think}\n</think>\n"
+    else:
+        text = think
+    return rng.choice(["", " ", "\n"]) + text + rng.choice(["", "\n", "  "])
+
+
+def load_completions(path):
+    completions, tasks = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            completions.append(entry["completion"])
+            tasks.append(entry.get("task", "real"))
+    return completions, tasks
+
+
+def run_all(module, prompts, completions, tasks):
+    # 屏蔽 format_reward 的 print，只比较奖励计算本身
+    with redirect_stdout(io.StringIO()):
+        return {
+            name: getattr(module, name)(prompts=prompts, completions=completions, task=tasks)
+            for name in REWARD_FUNCS
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check reward_engine against the original reward functions")
+    parser.add_argument("--completions", type=str, default=None,
+                        help="Optional JSONL with {completion, task} records (default: synthetic completions)")
+    parser.add_argument("--num", type=int, default=4096, help="Number of synthetic completions")
+    parser.add_argument("--num_generations", type=int, default=8, help="Completions per prompt in one reward call")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    if args.completions:
+        completions, tasks = load_completions(args.completions)
+    else:
+        rng = random.Random(args.seed)
+        completions = [synthetic_completion(rng) for _ in range(args.num)]
+        tasks = [rng.choice(["real", "fake"]) for _ in completions]
+
+    batch = args.num_generations * 2
+    batches = [
+        (completions[i:i + batch], tasks[i:i + batch])
+        for i in range(0, len(completions), batch)
+    ]
+
+    timings = {}
+    outputs = {}
+    for name, module in [("original", rewards), ("engine", reward_engine)]:
+        best = None
+        for _ in range(args.repeat):
+            reward_engine.parse_completion.cache_clear()
+            start = time.perf_counter()
+            result = {fn: [] for fn in REWARD_FUNCS}
+            for batch_completions, batch_tasks in batches:
+                prompts = [""] * len(batch_completions)
+                for fn, values in run_all(module, prompts, batch_completions, batch_tasks).items():
+                    result[fn].extend(values)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        outputs[name] = result
+
+    mismatches = 0
+    for fn in REWARD_FUNCS:
+        diff = [i for i, (a, b) in enumerate(zip(outputs["original"][fn], outputs["engine"][fn])) if a != b]
+        mismatches += len(diff)
+        status = "OK" if not diff else f"{len(diff)} mismatches, e.g. #{diff[0]}"
+        print(f"{fn:<24} {status}")
+
+    print("=" * 60)
+    print(f"Completions: {len(completions)} in {len(batches)} reward batches")
+    print(f"original: {timings['original'] * 1000:.1f} ms")
+    print(f"engine:   {timings['engine'] * 1000:.1f} ms")
+    print(f"speedup:  {timings['original'] / timings['engine']:.2f}x")
+    print("=" * 60)
+    if mismatches:
+        raise SystemExit(f"{mismatches} reward values differ")
+
+
+if __name__ == "__main__":
+    main()
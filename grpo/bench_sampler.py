@@ -0,0 +1,62 @@
+import os
+import json
+import argparse
+
+from sampler import LengthGroupedRepeatSampler, dataset_lengths
+
+# 不加载模型，按 TRL 的切分方式模拟每个进程一次生成拿到的 prompt，统计 prompt 左侧 padding 比例：
+# TRL 的 dataloader 每个进程每次取 per_device_train_batch_size * steps_per_generation 条 completion，
+# 全局生成批按进程顺序切开。每个进程只拿到一个 prompt（8 条生成）时没有 padding，分组也就没有作用。
+
+
+def load_lengths(path):
+    # prepare_data.py 的 Arrow 目录用 prompt_len 列，jsonl 用字符数近似（与 dataset_lengths 一致）
+    if os.path.isdir(path):
+        from datasets import load_from_disk
+        return dataset_lengths(load_from_disk(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return [len(json.loads(line)["prompt"]) for line in f if line.strip()]
+
+
+def padding_ratio(lengths, processes, per_device, steps_per_generation, num_generations, mega_batch_mult, seed=0):
+    local = per_device * steps_per_generation
+    generation_batch = local * processes
+    sampler = LengthGroupedRepeatSampler(
+        lengths, mini_repeat_count=num_generations, batch_size=generation_batch // num_generations,
+        repeat_count=1, seed=seed, mega_batch_mult=mega_batch_mult,
+    )
+    indexes = list(sampler)
+    real = padded = 0
+    for start in range(0, len(indexes) - generation_batch + 1, generation_batch):
+        for p in range(processes):
+            batch = [lengths[i] for i in indexes[start + p * local:start + (p + 1) * local]]
+            real += sum(batch)
+            padded += max(batch) * len(batch)
+    return 1.0 - real / padded if padded else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟按长度分组对每个进程生成批 prompt padding 的影响")
+    parser.add_argument("--data", type=str, default="../datasets/prepared/train", help="prepare_data.py 的输出目录或含 prompt 字段的 jsonl")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--per_device", type=int, default=2, help="per_device_train_batch_size")
+    parser.add_argument("--steps_per_generation", type=int, nargs='+', default=[4, 16])
+    parser.add_argument("--num_generations", type=int, default=8)
+    parser.add_argument("--mega_batch_mult", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lengths = load_lengths(args.data)
+    print(f"prompt 数: {len(lengths)}")
+    print(f"{'steps_per_generation':>22}{'每进程 prompt 数':>16}{'随机':>10}{'按长度分组':>12}")
+    for steps in args.steps_per_generation:
+        per_process = args.per_device * steps / args.num_generations
+        ratios = [
+            padding_ratio(lengths, args.processes, args.per_device, steps, args.num_generations, mult, args.seed)
+            for mult in (1, args.mega_batch_mult)
+        ]
+        print(f"{steps:>22}{per_process:>16g}{ratios[0]:>10.3f}{ratios[1]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
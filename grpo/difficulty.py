@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+
+# 按数据集 idx 记录每个 prompt 的历史：生成次数、user_reward_func 判对次数、
+# 连续出现零优势组（同组所有生成总奖励相同）的次数。各 rank 用 gather 后的同一份数据更新，
+# 因此 DifficultyScheduledSampler 在所有 rank 上做出相同的采样决定。
+
+
+class DifficultyTracker:
+    def __init__(self, num_prompts):
+        self.attempts = np.zeros(num_prompts, dtype=np.int64)
+        self.passes = np.zeros(num_prompts, dtype=np.int64)
+        self.visits = np.zeros(num_prompts, dtype=np.int64)
+        self.zero_streak = np.zeros(num_prompts, dtype=np.int64)
+
+        self.groups = 0
+        self.zero_groups = 0
+        self.skipped_prompts = 0
+        self.scheduled_prompts = 0
+
+    def update(self, idx, passed, zero_advantage):
+        # idx / passed: 每条 completion 一个值；zero_advantage: 每条 completion 所在组是否零优势
+        idx = np.asarray(idx, dtype=np.int64)
+        passed = np.asarray(passed, dtype=np.int64)
+        zero_advantage = np.asarray(zero_advantage, dtype=bool)
+
+        np.add.at(self.attempts, idx, 1)
+        np.add.at(self.passes, idx, passed)
+
+        groups, first = np.unique(idx, return_index=True)
+        zero = zero_advantage[first]
+        self.visits[groups] += 1
+        self.zero_streak[groups] = np.where(zero, self.zero_streak[groups] + 1, 0)
+        self.groups += len(groups)
+        self.zero_groups += int(zero.sum())
+        return len(groups), int(zero.sum())
+
+    def pass_rate(self):
+        # Beta(1, 1) 先验，没见过的 prompt 为 0.5
+        return (self.passes + 1) / (self.attempts + 2)
+
+    def uncertainty(self):
+        p = self.pass_rate()
+        return p * (1 - p)
+
+    def saturated(self, patience):
+        return self.zero_streak >= patience
+
+    def record_schedule(self, n_skipped):
+        self.skipped_prompts += n_skipped
+        self.scheduled_prompts += len(self.attempts)
+
+    def summary(self):
+        seen = self.visits > 0
+        rate = self.pass_rate()
+        return {
+            "prompts_seen": int(seen.sum()),
+            "groups": self.groups,
+            "zero_advantage_groups": self.zero_groups,
+            "zero_advantage_ratio": self.zero_groups / self.groups if self.groups else 0.0,
+            "always_correct": int((seen & (self.passes == self.attempts)).sum()),
+            "never_correct": int((seen & (self.passes == 0)).sum()),
+            "mean_pass_rate": float(rate[seen].mean()) if seen.any() else 0.0,
+            "skipped_prompts": self.skipped_prompts,
+            "skipped_ratio": self.skipped_prompts / self.scheduled_prompts if self.scheduled_prompts else 0.0,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                "summary": self.summary(),
+                "attempts": self.attempts.tolist(),
+                "passes": self.passes.tolist(),
+                "zero_streak": self.zero_streak.tolist(),
+            }, f)
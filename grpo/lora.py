@@ -0,0 +1,46 @@
+import logging
+
+# 按领域训练 LoRA 适配器：基座权重冻结，每个数据集只保存几十 MB 的适配器，
+# 审核端（audit/multi_audit.py、service.py 的 --adapters）加载一份基座后按数据集切换。
+
+# 训练数据没有领域字段，按 prompt 中交互列表的说明判断（与 audit_users.build_prompt 的模板一致）
+DOMAIN_MARKERS = {
+    "ml-1M": "list of movies",
+    "MIND": "list of news items",
+    "Clothing": "list of fashion products",
+}
+
+# Qwen2 的注意力和 MLP 投影层
+TARGET_MODULES = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+
+
+def prompt_domain(prompt):
+    for domain, marker in DOMAIN_MARKERS.items():
+        if marker in prompt:
+            return domain
+    return None
+
+
+def select_domain(dataset, domain):
+    if domain not in DOMAIN_MARKERS:
+        raise ValueError(f"未知领域 {domain}，可选 {list(DOMAIN_MARKERS)}")
+    selected = dataset.filter(lambda prompt: prompt_domain(prompt) == domain, input_columns="prompt")
+    if len(selected) == 0:
+        raise ValueError(f"训练集中没有 {domain} 领域的 prompt")
+    logging.info(f"LoRA 领域 {domain}: 选中 {len(selected)} / {len(dataset)} 条")
+    # 难度跟踪按 idx 索引数组，过滤后重新编号
+    return selected.remove_columns("idx").add_column("idx", list(range(len(selected))))
+
+
+def make_lora_config(rank=16, alpha=32, dropout=0.05, target_modules=None):
+    try:
+        from peft import LoraConfig
+    except ImportError:
+        raise ImportError("LoRA 训练需要 peft（pip install peft）")
+    return LoraConfig(
+        r=rank,
+        lora_alpha=alpha,
+        lora_dropout=dropout,
+        target_modules=target_modules or TARGET_MODULES,
+        task_type="CAUSAL_LM",
+    )
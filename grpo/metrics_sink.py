@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+from transformers import TrainerCallback
+
+# 每次奖励函数调用写一行 JSONL：{"step", "rank", "reward", "values", ...}。
+# user_reward_func 额外记录预测标签 pred 和真实标签 task，str_count.py 据此流式统计准确率。
+# 序列化和写盘都在后台线程完成，训练线程只做一次入队。
+
+
+class MetricsSink:
+    def __init__(self, path, flush_every=256, flush_interval=5.0):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.rank = int(os.environ.get("RANK", 0))
+        self.step = 0
+
+        self._queue = queue.Queue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    def log(self, reward, values, **extra):
+        self._queue.put({"step": self.step, "rank": self.rank, "time": time.time(),
+                         "reward": reward, "values": list(values), **extra})
+
+    def _writer(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = False
+            if record is None:
+                break
+            if record:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                pending += 1
+            if pending and (pending >= self.flush_every or time.monotonic() - last_flush >= self.flush_interval):
+                self._file.flush()
+                pending = 0
+                last_flush = time.monotonic()
+        self._file.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+class MetricsSinkCallback(TrainerCallback):
+    # 把 global_step 同步给 sink，训练结束时写完剩余记录
+    def __init__(self, sink):
+        self.sink = sink
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.sink.step = state.global_step
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.sink.close()
+
+
+def rank_path(metrics_dir):
+    return os.path.join(metrics_dir, f"rank{int(os.environ.get('RANK', 0))}.jsonl")
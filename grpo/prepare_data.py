@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import logging
+import argparse
+
+import numpy as np
+from datasets import Dataset, Features, Value, load_from_disk
+from transformers import AutoTokenizer
+
+# 一次流式完成 merge_dataset.py + chat_template.py 的工作：
+# 逐行读取 fake/real，按分词器自带的 chat template 渲染（首行作为 system），
+# 分词统计 prompt 长度，写成分片的 Arrow 文件，train.py 用 load_from_disk 直接内存映射。
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+FEATURES = Features({
+    "idx": Value("int64"),
+    "prompt": Value("string"),
+    "task": Value("string"),
+    "prompt_len": Value("int32"),
+})
+
+
+def split_prompt(prompt):
+    first_newline_idx = prompt.find('\n')
+    if first_newline_idx == -1:
+        return prompt, ""
+    return prompt[:first_newline_idx], prompt[first_newline_idx + 1:]
+
+
+def iter_sources(sources):
+    for path, task in sources:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)["prompt"], task
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"文件 {path} 第 {line_no} 行格式错误: {str(e)}")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"文件 {path} 不存在")
+
+
+def generate_rows(sources, tokenizer_path, batch_size):
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+
+    def flush(batch, start):
+        texts = [
+            tokenizer.apply_chat_template(
+                [{"role": "system", "content": system}, {"role": "user", "content": user}],
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            for system, user in (split_prompt(prompt) for prompt, _ in batch)
+        ]
+        # 与 GRPOTrainer 对字符串 prompt 的分词方式一致（不再额外添加特殊 token）
+        lengths = tokenizer(texts, add_special_tokens=False, return_length=True)["length"]
+        for i, (text, (_, task), length) in enumerate(zip(texts, batch, lengths)):
+            yield {"idx": start + i, "prompt": text, "task": task, "prompt_len": length}
+
+    batch = []
+    count = 0
+    for item in iter_sources(sources):
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield from flush(batch, count)
+            count += len(batch)
+            batch = []
+    if batch:
+        yield from flush(batch, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge, template and tokenize GRPO training data into sharded Arrow files")
+    parser.add_argument("--fake_file", type=str, default="../datasets/original/fake.jsonl")
+    parser.add_argument("--real_file", type=str, default="../datasets/original/real.jsonl")
+    parser.add_argument("--tokenizer", type=str, default="../Qwen2.5-1.5B-Instruct")
+    parser.add_argument("--output_dir", type=str, default="../datasets/prepared/train")
+    parser.add_argument("--num_shards", type=int, default=8)
+    parser.add_argument("--batch_size", type=int, default=256, help="Prompts tokenized per call")
+    parser.add_argument("--max_prompt_length", type=int, default=8192,
+                        help="Only used to report how many prompts GRPOTrainer will truncate")
+    args = parser.parse_args()
+
+    cache_dir = args.output_dir.rstrip("/") + ".cache"
+    dataset = Dataset.from_generator(
+        generate_rows,
+        gen_kwargs={
+            "sources": [(args.fake_file, "fake"), (args.real_file, "real")],
+            "tokenizer_path": args.tokenizer,
+            "batch_size": args.batch_size,
+        },
+        features=FEATURES,
+        cache_dir=cache_dir,
+    )
+    dataset.save_to_disk(args.output_dir, num_shards=min(args.num_shards, max(1, len(dataset))))
+    dataset.cleanup_cache_files()
+    del dataset
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # 统计信息直接从内存映射的列读取
+    prepared = load_from_disk(args.output_dir).with_format("numpy")
+    lengths = prepared["prompt_len"]
+    n_fake = int((prepared["task"] == "fake").sum())
+    logging.info(f"写入 {args.output_dir}：共 {len(prepared)} 条（fake {n_fake}，real {len(prepared) - n_fake}）")
+    if len(lengths):
+        logging.info(
+            f"prompt 长度: 中位数 {int(np.median(lengths))}，p95 {int(np.percentile(lengths, 95))}，最大 {int(lengths.max())}，"
+            f"超过 {args.max_prompt_length} 的 {int((lengths > args.max_prompt_length).sum())} 条"
+        )
+    with open(os.path.join(args.output_dir, "prepare_args.json"), "w") as f:
+        json.dump(vars(args), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import re
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+# 每条 completion 只解析一次，六个奖励函数共用同一条解析记录。
+# 各字段与 rewards.py 中原始实现的正则逐一对应，bench_rewards.py 验证结果完全一致。
+
+ANSWER_RE = re.compile(r"<answer>\s*(Real|Fake)\s*</answer>", re.IGNORECASE | re.DOTALL)
+FORMAT_RE = re.compile(r"<think>\n.*?\n</think>\n<answer>\n(?:Real|Fake)\n</answer>", re.DOTALL)
+# 原实现中 <think>\s*(.*?)\s*</think> 与 <think>(.*?)</think> 的区别只在首尾空白，
+# 对单词统计和 \b 边界没有影响，因此统一取后者。
+THINK_RE = re.compile(r"<think>(.*?)</think>", re.IGNORECASE | re.DOTALL)
+WORD_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+LONG_WORD_RE = re.compile(r"[A-Za-z]{21}")
+REAL_RE = re.compile(r"\breal\b", re.IGNORECASE)
+FAKE_RE = re.compile(r"\bfake\b", re.IGNORECASE)
+NUMBERED_RE = re.compile(r"\d+\..*\n\d+\..*\n\d+\..*")
+
+ParsedCompletion = namedtuple("ParsedCompletion", [
+    "label",            # 'real' / 'fake' / None
+    "format_ok",        # 严格格式 <think>...</think><answer>...</answer>
+    "has_think",
+    "think_words",      # think 中英文单词数（含撇号）
+    "long_word",        # think 中是否出现超过 20 个字母的单词
+    "mentions_real",
+    "mentions_fake",
+    "numbered_list",    # 是否包含三行连续编号
+])
+
+# 训练时由 train.py 设置：SINK 为 MetricsSink，VERBOSE 控制逐条 completion 的打印和 DEBUG 日志
+SINK = None
+VERBOSE = True
+
+
+def configure(sink=None, verbose=True):
+    global SINK, VERBOSE
+    SINK = sink
+    VERBOSE = verbose
+
+
+def record(name, rewards, **extra):
+    if SINK is not None:
+        SINK.log(name, rewards, **extra)
+
+
+@lru_cache(maxsize=4096)
+def parse_completion(completion):
+    answer = ANSWER_RE.search(completion)
+    think = THINK_RE.search(completion)
+    think_text = think.group(1) if think else ""
+    return ParsedCompletion(
+        label=answer.group(1).strip().lower() if answer else None,
+        format_ok=FORMAT_RE.fullmatch(completion.strip()) is not None,
+        has_think=think is not None,
+        think_words=sum(1 for _ in WORD_RE.finditer(think_text)),
+        long_word=LONG_WORD_RE.search(think_text) is not None,
+        mentions_real=REAL_RE.search(think_text) is not None,
+        mentions_fake=FAKE_RE.search(think_text) is not None,
+        numbered_list=NUMBERED_RE.search(completion) is not None,
+    )
+
+
+def extract_label(completion: str):
+    label = parse_completion(completion).label
+    if label is None and VERBOSE:
+        logging.warning(f"无法提取标签: {completion}")
+    return label
+
+
+def format_reward(completions, **kwargs):
+    rewards = []
+    for i, completion in enumerate(completions):
+        reward = 0.5 if parse_completion(completion).format_ok else 0.0
+        rewards.append(reward)
+
+        if VERBOSE:
+            print(f"\n--- Completion #{i+1} ---")
+            print(completion.strip())
+            print(f" format_reward: {reward}\n")
+
+    record("format_reward", rewards)
+    return rewards
+
+
+def user_reward_func(prompts, completions, task, **kwargs):
+    rewards = []
+    labels = []
+    for prompt, completion, t in zip(prompts, completions, task):
+        label = extract_label(completion)
+        labels.append(label)
+        if label is None:
+            if VERBOSE:
+                logging.warning(f"奖励设为 -1，因为无法提取标签: {completion}")
+            rewards.append(-1.0)
+            continue
+
+        expected = str(t).strip().lower()
+        if expected in ("real", "fake"):
+            if label == expected:
+                reward = 1.0
+                if VERBOSE:
+                    logging.debug(f"任务: {expected}, 预测: {label}, 奖励: {reward}")
+            elif expected == "fake" and label == "real":
+                # 特殊情况：恶意用户(fake)被识别成正常(real)，额外惩罚 -0.25
+                reward = -1.25
+                if VERBOSE:
+                    logging.debug(f"任务: {expected}, 预测: {label}, 严重错误 -> 奖励 {reward}")
+            else:
+                reward = -1.0
+                if VERBOSE:
+                    logging.debug(f"任务: {expected}, 预测: {label}, 奖励: {reward}")
+        else:
+            logging.warning(f"未知任务类型: {t}")
+            reward = 0.0
+
+        rewards.append(reward)
+    record("user_reward_func", rewards, pred=labels, task=[str(t).strip().lower() for t in task])
+    return rewards
+
+
+def verbose_think_reward(prompts, completions, **kwargs):
+    rewards = []
+    for completion in completions:
+        parsed = parse_completion(completion)
+        if not parsed.has_think:
+            rewards.append(0.0)
+            continue
+        rewards.append(0.25 if 60 < parsed.think_words < 130 else 0.0)
+    record("verbose_think_reward", rewards)
+    return rewards
+
+
+def consistency_reward(prompts, completions, **kwargs):
+    rewards = []
+    for completion in completions:
+        parsed = parse_completion(completion)
+        # think 中出现与最终答案相反的标签则扣分
+        if parsed.label == "real":
+            rewards.append(-0.5 if parsed.mentions_fake else 0.0)
+        elif parsed.label == "fake":
+            rewards.append(-0.5 if parsed.mentions_real else 0.0)
+        else:
+            rewards.append(0.0)
+    record("consistency_reward", rewards)
+    return rewards
+
+
+def format_bonus_reward(prompts, completions, task, **kwargs):
+    rewards = [0.25 if parse_completion(completion).numbered_list else 0.0 for completion in completions]
+    record("format_bonus_reward", rewards)
+    return rewards
+
+
+def nonsense_penalty(prompts, completions, **kwargs):
+    rewards = [-0.5 if parse_completion(completion).long_word else 0.0 for completion in completions]
+    record("nonsense_penalty", rewards)
+    return rewards
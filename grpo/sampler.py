@@ -0,0 +1,93 @@
+import torch
+from torch.utils.data import Sampler
+
+# 与 TRL 的 RepeatSampler 输出格式相同（每个 prompt 连续重复 mini_repeat_count 次，
+# 每组 batch_size 个 prompt 整体重复 repeat_count 次），区别在于组内 prompt 长度相近：
+# 先整体打乱，再在 batch_size * mega_batch_mult 的大块内按长度排序切组，最后打乱组的顺序。
+# 大块越小越接近完全随机，越大 padding 越少。
+
+
+class LengthGroupedRepeatSampler(Sampler):
+    def __init__(self, lengths, mini_repeat_count, batch_size=1, repeat_count=1,
+                 shuffle=True, seed=None, mega_batch_mult=32):
+        self.lengths = lengths
+        self.mini_repeat_count = mini_repeat_count
+        self.batch_size = batch_size
+        self.repeat_count = repeat_count
+        self.num_samples = len(lengths)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.mega_batch_mult = mega_batch_mult
+        self.generator = torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+
+    def epoch_indexes(self):
+        if self.shuffle:
+            return torch.randperm(self.num_samples, generator=self.generator).tolist()
+        return list(range(self.num_samples))
+
+    def batches(self):
+        indexes = self.epoch_indexes()
+
+        mega_size = self.batch_size * self.mega_batch_mult
+        chunks = []
+        for start in range(0, len(indexes), mega_size):
+            mega = sorted(indexes[start:start + mega_size], key=lambda i: self.lengths[i], reverse=True)
+            chunks.extend(mega[i:i + self.batch_size] for i in range(0, len(mega), self.batch_size))
+        chunks = [chunk for chunk in chunks if len(chunk) == self.batch_size]
+
+        if self.shuffle:
+            order = torch.randperm(len(chunks), generator=self.generator).tolist()
+            chunks = [chunks[i] for i in order]
+        return chunks
+
+    def __iter__(self):
+        for chunk in self.batches():
+            for _ in range(self.repeat_count):
+                for index in chunk:
+                    for _ in range(self.mini_repeat_count):
+                        yield index
+
+    def __len__(self):
+        return (self.num_samples // self.batch_size) * self.batch_size * self.mini_repeat_count * self.repeat_count
+
+
+class DifficultyScheduledSampler(LengthGroupedRepeatSampler):
+    # 每个 epoch 开始时参考 DifficultyTracker：连续 patience 次所有生成奖励相同（零优势）的 prompt
+    # 以 1 - recheck_prob 的概率跳过，空出的位置按通过率不确定性 p(1-p) 从其余 prompt 中补采，
+    # 保证每个 epoch 的步数和每步的 prompt 数不变。
+    # 跳过只在 epoch 开始时决定：第一个 epoch 内还没有统计，patience=1 时从第二个 epoch 起生效，
+    # patience=k 时最早从第 k+1 个 epoch 起生效。epoch 内的零优势组由 trainer 的 mask_zero_advantage 处理。
+    def __init__(self, lengths, tracker, *args, patience=1, recheck_prob=0.1, **kwargs):
+        super().__init__(lengths, *args, **kwargs)
+        self.tracker = tracker
+        self.patience = patience
+        self.recheck_prob = recheck_prob
+
+    def epoch_indexes(self):
+        indexes = super().epoch_indexes()
+        saturated = self.tracker.saturated(self.patience)
+        if not saturated.any():
+            self.tracker.record_schedule(0)
+            return indexes
+
+        recheck = torch.rand(self.num_samples, generator=self.generator).numpy() < self.recheck_prob
+        skip = saturated & ~recheck
+        kept = [i for i in indexes if not skip[i]]
+        n_skipped = len(indexes) - len(kept)
+        if kept and n_skipped:
+            weights = torch.as_tensor(self.tracker.uncertainty()[kept] + 0.05, dtype=torch.float)
+            picks = torch.multinomial(weights, n_skipped, replacement=True, generator=self.generator).tolist()
+            kept += [kept[j] for j in picks]
+            order = torch.randperm(len(kept), generator=self.generator).tolist()
+            kept = [kept[j] for j in order]
+        self.tracker.record_schedule(n_skipped)
+        return kept or indexes
+
+
+def dataset_lengths(dataset):
+    # prepare_data.py 写出的 prompt_len 列；旧的 jsonl 数据没有该列，用字符数近似
+    if "prompt_len" in dataset.column_names:
+        return dataset.with_format("numpy")["prompt_len"].tolist()
+    return [len(prompt) for prompt in dataset["prompt"]]
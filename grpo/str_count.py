@@ -1,14 +1,125 @@
 # count_score.py
-log_path = "../logs/output.log"
-targets = ["<answer>\nReal\n</answer>","<answer>\nFake\n</answer>","奖励: 1.0","奖励: -1.0","严重错误"]
-
-with open(log_path, 'r', encoding='utf-8') as f:
-    content = f.read()
-
-counts=[]
-for target in targets:
-    count = content.count(target)
-    counts.append(count)
-    print(f'🔢 "{target}" 出现次数: {count}')
-print(f"ratio: {counts[0]/sum(counts[:2])}")
-print(f"accuracy: {counts[-3]/(counts[-1]+counts[-2]+counts[-3])}")
\ No newline at end of file
+# 流式统计训练指标：默认读取 metrics_sink 写出的 JSONL（../logs/metrics/rank*.jsonl），
+# 也可以用 --log 按块扫描旧的训练日志，不再整文件读入内存。
+import os
+import glob
+import json
+import argparse
+from collections import defaultdict
+
+LOG_TARGETS = ["<answer>\nReal\n</answer>", "<answer>\nFake\n</answer>", "奖励: 1.0", "奖励: -1.0", "严重错误"]
+
+
+class TrainingStats:
+    # 与旧版统计口径一致：accuracy = 正确 / (正确 + 错误 + 严重错误)，无法提取标签的不计入分母
+    def __init__(self):
+        self.pred = {"real": 0, "fake": 0}
+        self.correct = 0
+        self.wrong = 0
+        self.severe = 0
+        self.unparsed = 0
+        self.reward_sum = defaultdict(float)
+        self.reward_count = defaultdict(int)
+        self.steps = defaultdict(lambda: [0, 0])  # step -> [correct, judged]
+
+    def add(self, record):
+        name = record["reward"]
+        values = record["values"]
+        self.reward_sum[name] += sum(values)
+        self.reward_count[name] += len(values)
+        if name != "user_reward_func":
+            return
+
+        step = self.steps[record["step"]]
+        for pred, task in zip(record["pred"], record["task"]):
+            if pred is None:
+                self.unparsed += 1
+                continue
+            self.pred[pred] += 1
+            if task not in ("real", "fake"):
+                continue
+            step[1] += 1
+            if pred == task:
+                self.correct += 1
+                step[0] += 1
+            elif task == "fake":
+                self.severe += 1
+            else:
+                self.wrong += 1
+
+    def judged(self):
+        return self.correct + self.wrong + self.severe
+
+    def report(self, per_step=False):
+        total_pred = self.pred["real"] + self.pred["fake"]
+        judged = self.judged()
+        print(f'🔢 预测 Real: {self.pred["real"]}  预测 Fake: {self.pred["fake"]}  无法提取: {self.unparsed}')
+        print(f'🔢 正确: {self.correct}  错误: {self.wrong}  严重错误: {self.severe}')
+        print(f"ratio: {self.pred['real'] / total_pred if total_pred else 0.0}")
+        print(f"accuracy: {self.correct / judged if judged else 0.0}")
+        print(f"severe error rate: {self.severe / judged if judged else 0.0}")
+        for name in sorted(self.reward_sum):
+            print(f"mean {name}: {self.reward_sum[name] / self.reward_count[name]:.4f}")
+        if per_step:
+            print("step\taccuracy\tn")
+            for step in sorted(self.steps):
+                correct, n = self.steps[step]
+                print(f"{step}\t{correct / n if n else 0.0:.4f}\t{n}")
+
+
+def metrics_files(paths):
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path])
+    return files
+
+
+def analyze_metrics(paths, per_step=False):
+    stats = TrainingStats()
+    for file in metrics_files(paths):
+        with open(file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # 训练仍在写入时最后一行可能不完整
+                stats.add(json.loads(line))
+    stats.report(per_step)
+
+
+def count_log(log_path, chunk_size=1 << 20):
+    # 目标串可能跨块（如 "<answer>\nReal\n</answer>"），每个目标保留 len-1 个字符的尾部，
+    # 尾部放不下完整目标，因此不会重复计数
+    counts = [0] * len(LOG_TARGETS)
+    tails = [""] * len(LOG_TARGETS)
+    with open(log_path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            for i, target in enumerate(LOG_TARGETS):
+                text = tails[i] + chunk
+                counts[i] += text.count(target)
+                tails[i] = text[max(0, len(text) - len(target) + 1):]
+
+    for target, count in zip(LOG_TARGETS, counts):
+        print(f'🔢 "{target}" 出现次数: {count}')
+    print(f"ratio: {counts[0]/sum(counts[:2])}")
+    print(f"accuracy: {counts[-3]/(counts[-1]+counts[-2]+counts[-3])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize GRPO training rewards and accuracy")
+    parser.add_argument("--metrics", type=str, nargs='+', default=["../logs/metrics"],
+                        help="Metrics JSONL files or directories written by metrics_sink.py")
+    parser.add_argument("--log", type=str, default=None,
+                        help="Count markers in a legacy training log instead (needs VERBOSE_COMPLETIONS in train.py)")
+    parser.add_argument("--per_step", action='store_true', help="Also print accuracy per training step")
+    args = parser.parse_args()
+
+    if args.log:
+        count_log(args.log)
+    else:
+        analyze_metrics(args.metrics, args.per_step)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,61 @@
-import re
 import logging
-from datasets import load_dataset
-from trl import GRPOTrainer, GRPOConfig
+from datasets import load_dataset, load_from_disk
+from trl import GRPOConfig
 import os
-from collections import Counter
+import reward_engine
+from reward_engine import (
+    user_reward_func, format_reward, format_bonus_reward,
+    verbose_think_reward, consistency_reward, nonsense_penalty,
+)
+from metrics_sink import MetricsSink, MetricsSinkCallback, rank_path
+from trainer import ShieldGRPOTrainer
+from lora import make_lora_config, select_domain
 
 os.environ["WANDB_MODE"] = "disabled"
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# prepare_data.py 生成的分片 Arrow 数据，存在时直接内存映射，否则回退到 train_qwen.jsonl
+PREPARED_DATA = "../datasets/prepared/train"
+
+# 奖励分量、预测标签按步写入 METRICS_DIR/rank{N}.jsonl，用 str_count.py 统计。
+# VERBOSE_COMPLETIONS 为 True 时恢复逐条 completion 打印和 DEBUG 奖励日志（旧版 str_count.py --log 依赖这些输出）。
+METRICS_DIR = "../logs/metrics"
+VERBOSE_COMPLETIONS = False
+
+# 按 prompt 长度分组采样；False 时退回 TRL 默认的随机采样。两种情况都会记录 prompt_padding_ratio
+GROUP_BY_LENGTH = True
+# 每个进程一次生成 per_device_train_batch_size * STEPS_PER_GENERATION 条 completion。
+# 默认的 4（= gradient_accumulation_steps）下每个进程只生成 1 个 prompt 的 8 条，本来就没有 padding，
+# 分组不起作用；16 时每个进程一次生成 4 个 prompt，分组才能减少 padding（bench_sampler.py 模拟对比）。
+# 一次生成供 4 个优化步使用，后 3 步略微 off-policy，由 TRL 的重要性采样比裁剪处理
+STEPS_PER_GENERATION = 16
+# 跳过连续 SATURATION_PATIENCE 次零优势（8 条生成奖励完全相同）的 prompt，并补采其他 prompt 保持批大小。
+# 只在 epoch 开始时决定，SATURATION_PATIENCE = 1 时从第二个 epoch 起生效
+SKIP_SATURATED = True
+SATURATION_PATIENCE = 1
+# 当前步内的零优势组不参与损失
+MASK_ZERO_ADVANTAGE = True
+
+# 设为 "ml-1M" / "MIND" / "Clothing" 时只用该领域的 prompt 训练 LoRA 适配器（基座冻结），
+# 保存到 ../checkpoints/adapters/<领域>；审核端用 --adapters 加载一份基座并按数据集切换。None 为全量训练
+LORA_DOMAIN = None
+LORA_RANK = 16
+LORA_ALPHA = 32
+
+logging.basicConfig(level=logging.DEBUG if VERBOSE_COMPLETIONS else logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+metrics_sink = MetricsSink(rank_path(METRICS_DIR))
+reward_engine.configure(sink=metrics_sink, verbose=VERBOSE_COMPLETIONS)
 
 try:
     logging.info("开始加载数据集")
-    train_dataset = load_dataset("json", data_files="../datasets/original/train_qwen.jsonl", split="train")
+    if os.path.isdir(PREPARED_DATA):
+        train_dataset = load_from_disk(PREPARED_DATA)
+    else:
+        train_dataset = load_dataset("json", data_files="../datasets/original/train_qwen.jsonl", split="train")
+        train_dataset = train_dataset.add_column("idx", list(range(len(train_dataset))))
+    if LORA_DOMAIN:
+        train_dataset = select_domain(train_dataset, LORA_DOMAIN)
     logging.info(f"数据集加载完成: 训练集 {len(train_dataset)} 条")
     logging.debug(f"数据集示例: {train_dataset[0]}")
 except FileNotFoundError:
@@ -21,161 +65,12 @@ except Exception as e:
     logging.error(f"数据集加载失败: {str(e)}")
     raise
 
-def extract_label(completion: str):
-    try:
-        match = re.search(r"<answer>\s*(Real|Fake)\s*</answer>", completion, re.IGNORECASE | re.DOTALL)
-        if match:
-            label = match.group(1).strip().lower()  # 'real' or 'fake'
-            logging.debug(f"提取标签成功: {label}")
-            return label
-        logging.warning(f"无法提取标签: {completion}")
-        return None
-    except Exception as e:
-        logging.error(f"提取标签失败: {str(e)}")
-        return None
-
-def format_reward(completions, **kwargs):
-    pattern = r"<think>\n.*?\n</think>\n<answer>\n(?:Real|Fake)\n</answer>"
-    rewards = []
-    for i, completion in enumerate(completions):
-        content = completion.strip()  
-        match = re.fullmatch(pattern, content, re.DOTALL)  
-        reward = 0.5 if match else 0.0
-        rewards.append(reward)
-
-        print(f"\n--- Completion #{i+1} ---")
-        print(content)
-        print(f" format_reward: {reward}\n")
-
-    return rewards
-
-def user_reward_func(prompts, completions, task, **kwargs):
-    rewards = []
-    for i, (prompt, completion, t) in enumerate(zip(prompts, completions, task)):
-        label = extract_label(completion)   
-        if label is None:
-            logging.warning(f"奖励设为 -1，因为无法提取标签: {completion}")
-            rewards.append(-1.0)
-            continue
-
-        expected = str(t).strip().lower()  
-        if expected in ("real", "fake"):
-            if label == expected:
-                reward = 1.0
-                logging.debug(f"任务: {expected}, 预测: {label}, 奖励: {reward}")
-            else:
-                # 特殊情况：恶意用户(fake)被识别成正常(real)，额外惩罚 -0.25
-                if expected == "fake" and label == "real":
-                    reward = -1.25
-                    logging.debug(f"任务: {expected}, 预测: {label}, 严重错误 -> 奖励 {reward}")
-                else:
-                    reward = -1.0
-                    logging.debug(f"任务: {expected}, 预测: {label}, 奖励: {reward}")
-        else:
-            logging.warning(f"未知任务类型: {t}")
-            reward = 0.0
-
-        rewards.append(reward)
-    return rewards
-
-
-def verbose_think_reward(prompts, completions, **kwargs):
-    rewards = []
-    for i, completion in enumerate(completions):
-        try:
-            m = re.search(r"<think>\s*(.*?)\s*</think>", completion, re.DOTALL | re.IGNORECASE)
-            if not m:
-                rewards.append(0.0)
-                logging.debug(f"[think长度奖励] 用户 {i} 未找到 <think> 内容，奖励 0")
-                continue
-
-            think_text = m.group(1)
-
-            # 仅统计英文单词（包含撇号的词，如 don't）
-            words = re.findall(r"[A-Za-z]+(?:'[A-Za-z]+)?", think_text)
-            count = len(words)
-
-            reward = 0.25 if (count > 60 and count <130) else 0.0
-            rewards.append(reward)
-            logging.debug(f"[think长度奖励] 用户 {i} 单词数={count} -> 奖励 {reward}")
-        except Exception as e:
-            logging.error(f"[think长度奖励] 解析失败: {str(e)}")
-            rewards.append(0.0)
-    return rewards
-
-
-def consistency_reward(prompts, completions, **kwargs):
-    rewards = []
-    for i, completion in enumerate(completions):
-        try:
-            # 提取 <answer> 最终标签
-            answer_match = re.search(r"<answer>\s*(Real|Fake)\s*</answer>", completion, re.IGNORECASE | re.DOTALL)
-            answer_label = answer_match.group(1).strip().lower() if answer_match else None
-
-            # 提取 <think> 内容
-            think_match = re.search(r"<think>(.*?)</think>", completion, re.IGNORECASE | re.DOTALL)
-            think_text = think_match.group(1) if think_match else ""
-
-            if answer_label:
-                opposite_label = "real" if answer_label == "fake" else "fake"
-
-                # 检查 think 中是否包含相反标签
-                if re.search(rf"\b{opposite_label}\b", think_text, re.IGNORECASE):
-                    reward = -0.5
-                    logging.debug(f"[一致性奖励] 用户 {i} think 含反标签 {opposite_label} -> 扣分 {reward}")
-                else:
-                    reward = 0.0
-                    logging.debug(f"[一致性奖励] 用户 {i} think 中未发现标签 -> 奖励 {reward}")
-            else:
-                reward = 0.0
-                logging.debug(f"[一致性奖励] 用户 {i} 无 answer 标签 -> 奖励 {reward}")
-
-            rewards.append(reward)
-        except Exception as e:
-            logging.error(f"[一致性奖励] 解析失败: {str(e)}")
-            rewards.append(0.0)
-    return rewards
-
-
-def format_bonus_reward(prompts, completions, task, **kwargs):
-    rewards = []
-    for i, completion in enumerate(completions):
-        if re.search(r"\d+\..*\n\d+\..*\n\d+\..*", completion):
-            rewards.append(0.25)
-            logging.debug(f"[格式奖励] 用户 {i} 包含编号格式，奖励+0.25")
-        else:
-            rewards.append(0.0)
-    return rewards
-
-def nonsense_penalty(prompts, completions, **kwargs):
-    rewards = []
-    for i, completion in enumerate(completions):
-        try:
-            m = re.search(r"<think>(.*?)</think>", completion, re.DOTALL | re.IGNORECASE)
-            if not m:
-                rewards.append(0.0)
-                continue
-
-            think_text = m.group(1).strip()
-            words = re.findall(r"[A-Za-z]+", think_text)
-
-            if any(len(w) > 20 for w in words):
-                reward = -0.5
-                logging.debug(f"[无意义词惩罚] 用户 {i} 出现超长单词 -> 扣分 {reward}")
-            else:
-                reward = 0.0
-
-            rewards.append(reward)
-        except Exception as e:
-            logging.error(f"[无意义词惩罚] 解析失败: {str(e)}")
-            rewards.append(0.0)
-    return rewards
-
 # 训练配置
 config = GRPOConfig(
-    output_dir="../checkpoints/model",
+    output_dir=f"../checkpoints/adapters/{LORA_DOMAIN}" if LORA_DOMAIN else "../checkpoints/model",
     per_device_train_batch_size=2,
     gradient_accumulation_steps=4,
+    steps_per_generation=STEPS_PER_GENERATION,
     num_generations=8,
     max_prompt_length=8192,
     log_completions=True,
@@ -194,11 +89,17 @@ config = GRPOConfig(
 
 try:
     logging.info("开始初始化 GRPOTrainer")
-    trainer = GRPOTrainer(
+    trainer = ShieldGRPOTrainer(
         model="../Qwen2.5-1.5B-Instruct",
         reward_funcs=[user_reward_func, format_reward, format_bonus_reward, verbose_think_reward, consistency_reward, nonsense_penalty],
         train_dataset=train_dataset,
         args=config,
+        callbacks=[MetricsSinkCallback(metrics_sink)],
+        group_by_length=GROUP_BY_LENGTH,
+        skip_saturated=SKIP_SATURATED,
+        saturation_patience=SATURATION_PATIENCE,
+        mask_zero_advantage=MASK_ZERO_ADVANTAGE,
+        peft_config=make_lora_config(LORA_RANK, LORA_ALPHA) if LORA_DOMAIN else None,
     )
     logging.info("开始训练")
     trainer.train()
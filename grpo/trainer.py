@@ -0,0 +1,115 @@
+import logging
+
+import torch
+from trl import GRPOTrainer
+
+from difficulty import DifficultyTracker
+from reward_engine import parse_completion
+from sampler import LengthGroupedRepeatSampler, DifficultyScheduledSampler, dataset_lengths
+
+
+class ShieldGRPOTrainer(GRPOTrainer):
+    # GRPOTrainer 的改动：
+    #   group_by_length: 同一生成批内的 prompt 长度相近，减少左侧 padding
+    #       （只在每个进程一次生成多个 prompt 时有效，见 train.py 的 STEPS_PER_GENERATION）
+    #   每步记录 prompt / completion 的 padding 比例，便于和随机采样对比
+    #   skip_saturated: 跟踪每个 prompt 的通过率和零优势组，epoch 开始时跳过连续零优势的 prompt 并补采；
+    #       只在 epoch 边界生效，补采的位置仍要生成和反向传播，因此这部分算力是被重新分配而不是节省
+    #   mask_zero_advantage: 当前步内零优势组的 completion_mask 置零，这些生成不再参与损失
+    #       （beta=0 时它们的梯度本来就是 0，只会按 token 数稀释其他组的损失）
+    def __init__(self, *args, group_by_length=True, mega_batch_mult=32,
+                 skip_saturated=True, saturation_patience=1, recheck_prob=0.1,
+                 mask_zero_advantage=True, **kwargs):
+        self.group_by_length = group_by_length
+        self.mega_batch_mult = mega_batch_mult
+        self.skip_saturated = skip_saturated
+        self.saturation_patience = saturation_patience
+        self.recheck_prob = recheck_prob
+        self.mask_zero_advantage = mask_zero_advantage
+        self.difficulty = None
+        super().__init__(*args, **kwargs)
+
+    def _get_train_sampler(self, dataset=None):
+        if not self.group_by_length and not self.skip_saturated:
+            return super()._get_train_sampler(dataset)
+        if dataset is None:
+            dataset = self.train_dataset
+        kwargs = dict(
+            mini_repeat_count=self.num_generations,
+            batch_size=self.args.generation_batch_size // self.num_generations,
+            repeat_count=self.num_iterations * self.args.steps_per_generation,
+            shuffle=self.shuffle_dataset,
+            seed=self.args.seed,
+            # mega_batch_mult=1 时每组只在自身内部排序，等价于随机分组
+            mega_batch_mult=self.mega_batch_mult if self.group_by_length else 1,
+        )
+        if self.skip_saturated:
+            if self.difficulty is None:
+                self.difficulty = DifficultyTracker(len(dataset))
+            return DifficultyScheduledSampler(
+                dataset_lengths(dataset), self.difficulty,
+                patience=self.saturation_patience, recheck_prob=self.recheck_prob, **kwargs
+            )
+        return LengthGroupedRepeatSampler(lengths=dataset_lengths(dataset), **kwargs)
+
+    def _generate_and_score_completions(self, inputs):
+        output = super()._generate_and_score_completions(inputs)
+        mode = "train" if self.model.training else "eval"
+        for name in ("prompt", "completion"):
+            mask = output[f"{name}_mask"]
+            counts = torch.tensor([mask.sum().item(), mask.numel()], dtype=torch.float, device=mask.device)
+            counts = self.accelerator.gather(counts).view(-1, 2).sum(0)
+            self._metrics[mode][f"{name}_padding_ratio"].append(1.0 - (counts[0] / counts[1]).item())
+
+        if mode == "train" and (self.difficulty is not None or self.mask_zero_advantage):
+            zero = self._zero_advantage(output)
+            if self.difficulty is not None:
+                self._track_difficulty(inputs, output, zero)
+            if self.mask_zero_advantage:
+                self._mask_zero_advantage(output, zero)
+        return output
+
+    def _zero_advantage(self, output):
+        # 返回 gather 后每条生成所在组是否零优势。
+        # gather 后同一 prompt 的 num_generations 条生成相邻，与 TRL 计算组内优势的排列一致
+        advantages = self.accelerator.gather(output["advantages"].detach())
+        zero = (advantages.view(-1, self.num_generations).abs().amax(dim=1) < 1e-6)
+        return zero.repeat_interleave(self.num_generations)
+
+    def _mask_zero_advantage(self, output, zero):
+        # 一组的生成可能分散在多个进程上，按 TRL 切分优势的方式取回本进程的部分
+        n = output["advantages"].shape[0]
+        local = zero[self.accelerator.process_index * n:(self.accelerator.process_index + 1) * n]
+        mask = output["completion_mask"]
+        masked = (mask * local.unsqueeze(1)).sum()
+        counts = self.accelerator.gather(torch.stack([masked, mask.sum()]).float()).view(-1, 2).sum(0)
+        output["completion_mask"] = mask * (~local).unsqueeze(1).to(mask.dtype)
+        self._metrics["train"]["masked_completion_ratio"].append((counts[0] / counts[1].clamp(min=1)).item())
+
+    def _track_difficulty(self, inputs, output, zero):
+        # 与 TRL 计算奖励时相同的解码方式，parse_completion 直接命中缓存
+        texts = self.processing_class.batch_decode(output["completion_ids"], skip_special_tokens=True)
+        passed = [
+            parse_completion(text).label == str(x["task"]).strip().lower()
+            for text, x in zip(texts, inputs)
+        ]
+        device = output["advantages"].device
+        idx = self.accelerator.gather(torch.tensor([x["idx"] for x in inputs], device=device))
+        passed = self.accelerator.gather(torch.tensor(passed, dtype=torch.long, device=device))
+        n_groups, n_zero = self.difficulty.update(idx.cpu().numpy(), passed.cpu().numpy(), zero.cpu().numpy())
+
+        summary = self.difficulty.summary()
+        self._metrics["train"]["zero_advantage_ratio"].append(n_zero / n_groups if n_groups else 0.0)
+        self._metrics["train"]["skipped_prompts"].append(summary["skipped_prompts"])
+        # 跳过的 prompt 空出的生成名额已补采给其他 prompt，并非节省的计算
+        self._metrics["train"]["reallocated_generations"].append(
+            summary["skipped_prompts"] * self.num_generations * self.num_iterations
+        )
+
+    def train(self, *args, **kwargs):
+        result = super().train(*args, **kwargs)
+        if self.difficulty is not None:
+            logging.info(f"prompt 难度统计: {self.difficulty.summary()}")
+            if self.accelerator.is_main_process:
+                self.difficulty.save(f"{self.args.output_dir}/difficulty.json")
+        return result